@@ -1,9 +1,17 @@
 # ComfyUI/custom_nodes/openai_style_prompt/__init__.py
-from .node import OpenAIStylePrompt
+from .node import OpenAIStylePrompt, OpenAIStylePromptBatch, OpenAIStylePromptMulti
+from .metrics import register_routes
 
 NODE_CLASS_MAPPINGS = {
-    "OpenAIStylePrompt": OpenAIStylePrompt
+    "OpenAIStylePrompt": OpenAIStylePrompt,
+    "OpenAIStylePromptBatch": OpenAIStylePromptBatch,
+    "OpenAIStylePromptMulti": OpenAIStylePromptMulti,
 }
 NODE_DISPLAY_NAME_MAPPINGS = {
-    "OpenAIStylePrompt": "OpenAI Style Prompt (Subjectless)"
+    "OpenAIStylePrompt": "OpenAI Style Prompt (Subjectless)",
+    "OpenAIStylePromptBatch": "OpenAI Style Prompt Batch (Subjectless)",
+    "OpenAIStylePromptMulti": "OpenAI Style Prompt Multi (Subjectless)",
 }
+
+# /openai_style_prompt/metrics (Prometheus) + /openai_style_prompt/metrics.json
+register_routes()
@@ -0,0 +1,186 @@
+# ComfyUI/custom_nodes/openai_style_prompt/analysis.py
+# Schnelle lokale Bildanalyse (vektorisiertes NumPy) auf dem bereits konvertierten Frame:
+# Palette, Helligkeit/Kontrast, Farbtemperatur, Sättigung, Kantendichte, Himmel/Horizont.
+# Die Konfidenz entscheidet, ob template_mode="auto" ein Vision-Request lokal beantwortet.
+from __future__ import annotations
+from typing import List, Optional
+
+ANALYSIS_SIDE = 128  # Analyse auf einer kleinen Kopie: wenige ms, Ergebnis praktisch gleich
+KEYED_MIN = 0.4      # Mindestanteil eines Green-/Bluescreens am Bild
+
+# Farbton-Bins (Grad, Obergrenze exklusiv) -> Name
+_HUES = ((15, "red"), (45, "orange"), (70, "yellow"), (165, "green"), (200, "cyan"),
+         (260, "blue"), (290, "purple"), (335, "magenta"), (361, "red"))
+_NAMES_DE = {"red": "Rot", "orange": "Orange", "yellow": "Gelb", "green": "Grün", "cyan": "Cyan", "blue": "Blau",
+             "purple": "Violett", "magenta": "Magenta", "black": "Schwarz", "gray": "Grau", "white": "Weiß"}
+_SKIES = {"overcast": ("bedeckter Himmel", "overcast sky"), "blue": ("offener blauer Himmel", "open blue sky"),
+          "warm": ("warmer Abendhimmel", "warm evening sky")}
+
+
+def _thumb(pil, side: int):
+    """Kleine float32-RGB-Kopie in [0, 1]."""
+    import numpy as np
+    img = pil.convert("RGB")
+    if max(img.size) > side:
+        img = img.copy()
+        img.thumbnail((side, side))
+    return np.asarray(img, dtype=np.float32) / 255.0
+
+
+def analyze(pil, side: int = ANALYSIS_SIDE) -> Optional[dict]:
+    """Bildmerkmale + `confidence` (0..1, wie eindeutig die Szene mit Template-Phrasen beschreibbar ist)."""
+    if pil is None:
+        return None
+    try:
+        import numpy as np
+        rgb = _thumb(pil, side)
+    except Exception:
+        return None
+    if rgb.ndim != 3 or min(rgb.shape[:2]) < 4:
+        return None
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    lum = 0.2126 * r + 0.7152 * g + 0.0722 * b
+    mx, mn = rgb.max(axis=2), rgb.min(axis=2)
+    delta = mx - mn
+    sat = delta / np.maximum(mx, 1e-6)
+    d = np.maximum(delta, 1e-6)
+    hue = np.where(mx == r, ((g - b) / d) % 6.0, np.where(mx == g, (b - r) / d + 2.0, (r - g) / d + 4.0)) * 60.0
+
+    # Palette: achromatisch nach Helligkeit, sonst nach Farbton
+    achrom = (sat < 0.15) | (mx < 0.12)
+    bins = np.searchsorted(np.array([h for h, _ in _HUES]), hue, side="right")
+    bins = np.where(achrom, len(_HUES) + np.digitize(lum, (0.2, 0.8)), bins)
+    names = [n for _, n in _HUES] + ["black", "gray", "white"]
+    counts = np.bincount(bins.ravel(), minlength=len(names)).astype(np.float64)
+    shares: dict = {}
+    for i, c in enumerate(counts):
+        if c:
+            shares[names[i]] = shares.get(names[i], 0.0) + float(c) / lum.size
+    palette = sorted(shares.items(), key=lambda kv: -kv[1])[:3]
+
+    # Kantendichte: Anteil deutlicher Helligkeitssprünge
+    grad = np.abs(np.diff(lum, axis=1))[:-1, :] + np.abs(np.diff(lum, axis=0))[:, :-1]
+    edges = float((grad > 0.08).mean())
+
+    # Horizont: Ende eines himmelartigen Bandes ab Oberkante, sonst der stärkste Helligkeitssprung zwischen Zeilen
+    h = lum.shape[0]
+    sky_px = ((hue >= 180) & (hue < 250) & (sat >= 0.12) & (lum > 0.35)) | ((sat < 0.12) & (lum > 0.65))
+    rows = sky_px.mean(axis=1) > 0.6
+    band = h if rows.all() else int(np.argmin(rows))
+    prof = lum.mean(axis=1)
+    jump = np.abs(np.diff(prof))
+    k = int(jump.argmax()) + 1
+    if 0.08 * h <= band < 0.92 * h:
+        horizon_row = band
+    elif jump[k - 1] > 0.12 and 0.08 * h <= k < 0.92 * h and prof[:k].mean() > prof[k:].mean():
+        horizon_row = k
+    else:
+        horizon_row = 0
+    sky_kind = None
+    if horizon_row:
+        top, top_sat = rgb[:horizon_row], sat[:horizon_row]
+        top_hue = hue[:horizon_row][top_sat >= 0.12]
+        if float(top_sat.mean()) < 0.12 and float(lum[:horizon_row].mean()) > 0.5:
+            sky_kind = "overcast"
+        elif top_hue.size > top_sat.size // 2 and float(((top_hue >= 180) & (top_hue < 250)).mean()) > 0.5:
+            sky_kind = "blue"
+        elif float((top[..., 0] - top[..., 2]).mean()) > 0.2:
+            sky_kind = "warm"
+
+    # Keying-Hintergrund (Green-/Bluescreen): kräftig gesättigt und hell, nicht bloß grünliche Vegetation;
+    # Pixel eines erkannten Himmelsbandes zählen nicht (tiefblauer Himmel ist kein Bluescreen)
+    keyed = (sat > 0.5) & (mx > 0.35)
+    if horizon_row and horizon_row == band:
+        keyed[:horizon_row] &= ~sky_px[:horizon_row]
+    green = _backdrop(keyed & (hue >= 80) & (hue < 160), hue, lum)
+    blue = _backdrop(keyed & (hue >= 200) & (hue < 250), hue, lum)
+    if max(green, blue) >= KEYED_MIN:
+        horizon_row, sky_kind = 0, None  # eine Keying-Wand hat keinen Horizont
+
+    feats = {
+        "palette": [(n, round(s, 3)) for n, s in palette],
+        "luminance": float(lum.mean()),
+        "contrast": float(lum.std()),
+        "temperature": float(np.clip((r - b).mean() * 4.0, -1.0, 1.0)),  # <0 kühl, >0 warm
+        "saturation": float(sat.mean()),
+        "edge_density": edges,
+        "greenscreen": green,
+        "bluescreen": blue,
+        "sky": sky_kind,
+        "horizon": horizon_row / h if horizon_row else None,
+    }
+    feats["confidence"] = _confidence(feats)
+    return feats
+
+
+def _backdrop(mask, hue, lum) -> float:
+    """Flächenanteil eines Keying-Hintergrunds – nur wenn er gleichmäßig ist (geringe Streuung von
+    Farbton und Helligkeit) und hinter dem Motiv bis an Ober- und Seitenränder reicht, sonst 0."""
+    share = float(mask.mean())
+    if share < KEYED_MIN:
+        return 0.0
+    if float(mask[0].mean()) < 0.5 or float(mask[:, [0, -1]].mean()) < 0.5:  # Rasen/Wiese berührt den oberen Rand nicht
+        return 0.0
+    if float(hue[mask].std()) > 12.0 or float(lum[mask].std()) > 0.1:
+        return 0.0
+    return share
+
+
+def _confidence(f: dict) -> float:
+    """Heuristik: Keying-Hintergründe sind eindeutig; sonst zählen ruhige Flächen, eine dominante
+    Palette und ein klarer Horizont. Detailreiche, bunte Motive -> niedrig (lieber die API fragen)."""
+    keyed = max(f["greenscreen"], f["bluescreen"])
+    if keyed >= KEYED_MIN:
+        return round(min(1.0, 0.55 + keyed * 0.5), 3)
+    flat = 1.0 - min(1.0, f["edge_density"] / 0.3)
+    dominance = sum(s for _, s in f["palette"][:2])
+    horizon = 1.0 if f["horizon"] is not None and f["sky"] else 0.0
+    return round(0.45 * flat + 0.35 * dominance + 0.2 * horizon, 3)
+
+
+def describe(f: Optional[dict], language: str = "en") -> List[str]:
+    """Merkmale -> Licht-/Tonphrasen für den Template-Prompt."""
+    if not f:
+        return []
+    de = language == "de"
+    out = []
+    keyed = max(f["greenscreen"], f["bluescreen"]) >= KEYED_MIN  # Farbe/Temperatur stammen dann vom Keying-Hintergrund
+    if f["greenscreen"] >= KEYED_MIN:
+        out.append("gleichmäßig ausgeleuchteter Greenscreen-Hintergrund" if de else "evenly lit chroma-green backdrop")
+    elif f["bluescreen"] >= KEYED_MIN:
+        out.append("gleichmäßig ausgeleuchteter Bluescreen-Hintergrund" if de else "evenly lit chroma-blue backdrop")
+    lum, con = f["luminance"], f["contrast"]
+    if lum < 0.25:
+        out.append("Low-Key, dunkle Belichtung" if de else "low-key, dark exposure")
+    elif lum > 0.7:
+        out.append("High-Key, helle Belichtung" if de else "high-key, bright exposure")
+    if con > 0.25:
+        out.append("harte Kontraste" if de else "hard contrast")
+    elif con < 0.12:
+        out.append("weiches, diffuses Licht" if de else "soft, diffuse light")
+    t = 0.0 if keyed else f["temperature"]
+    if t > 0.08:
+        out.append("warmes Licht" if de else "warm light")
+    elif t < -0.08:
+        out.append("kühles Licht" if de else "cool light")
+    if f["horizon"] is not None and not keyed:  # Backdrop und Himmel/Horizont schließen sich aus
+        sky = _SKIES.get(f["sky"])
+        if sky:
+            out.append(sky[0] if de else sky[1])
+        pos = f["horizon"]
+        third = ("im oberen Drittel" if de else "in the upper third") if pos < 0.4 else \
+                ("im unteren Drittel" if de else "in the lower third") if pos > 0.6 else ("mittig" if de else "centered")
+        out.append(f"Horizont {third}" if de else f"horizon {third}")
+    sat = None if keyed else f["saturation"]
+    if sat is not None and sat > 0.45:
+        out.append("satte Farben" if de else "saturated colors")
+    elif sat is not None and sat < 0.15:
+        out.append("gedämpfte, entsättigte Palette" if de else "muted, desaturated palette")
+    tones = [] if keyed else [(_NAMES_DE.get(n, n) if de else n) for n, s in f["palette"] if s >= 0.15]
+    if tones:
+        out.append(("dominante Töne: " if de else "dominant tones: ") + ", ".join(tones))
+    if f["edge_density"] < 0.05:
+        out.append("ruhige, klare Flächen" if de else "clean, uncluttered surfaces")
+    elif f["edge_density"] > 0.2:
+        out.append("stark strukturierte, detailreiche Umgebung" if de else "richly textured, detailed surroundings")
+    return out
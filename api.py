@@ -1,48 +1,120 @@
 # ComfyUI/custom_nodes/openai_style_prompt/api.py
-import time, re
+import asyncio, hashlib, json, os, sys, threading, re
+from functools import lru_cache
 from typing import List
 
-# OpenAI SDK (>=1.58) – Responses API
-try:
-    from openai import OpenAI
-except Exception:
-    OpenAI = None
+from . import metrics, ratelimit
+from .breaker import BREAKER, CircuitOpenError
+
+# OpenAI SDK (>=1.58) – Responses API; Import erst beim ersten Client (das SDK braucht
+# allein mehrere hundert ms, Cache-Treffer und Template-Mode kommen ohne aus)
+_SDK_MISSING = "openai-Paket fehlt. Bitte 'pip install openai>=1.58' installieren."
+
+def _openai():
+    try:
+        import openai
+    except Exception:
+        raise RuntimeError(_SDK_MISSING)
+    return openai
+
+DEADLINE_S = float(os.getenv("OPENAI_STYLE_PROMPT_DEADLINE_S", "90"))
+MAX_ATTEMPTS = int(os.getenv("OPENAI_STYLE_PROMPT_MAX_ATTEMPTS", "4"))
+HEDGE_AFTER_S = float(os.getenv("OPENAI_STYLE_PROMPT_HEDGE_AFTER_S", "6"))  # bis genug Latenz-Samples da sind
+HEDGE_MIN_SAMPLES = 20
 
 def ensure_client(api_key: str):
-    if OpenAI is None:
-        raise RuntimeError("openai-Paket fehlt. Bitte 'pip install openai>=1.58' installieren.")
-    return OpenAI(api_key=api_key)
+    """Client für die Sync-Wrapper (`call_openai`, `call_openai_once`): der geteilte AsyncOpenAI-Client,
+    denn auch die Wrapper laufen über den Async-Pfad auf dem geteilten Loop."""
+    return ensure_async_client(api_key)
+
+# ----- Shared event loop -----
+# Ein Hintergrund-Loop für alle Node-Instanzen: gleichzeitige Ausführungen überlappen
+# ihre Netzwerk-Wartezeiten, statt jeweils einen Thread zu blockieren.
+_LOOP = None
+_LOOP_LOCK = threading.Lock()
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    global _LOOP
+    with _LOOP_LOCK:
+        if _LOOP is None or _LOOP.is_closed():
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="OpenAIStylePrompt-loop", daemon=True).start()
+            _LOOP = loop
+    return _LOOP
+
+def run_sync(coro, timeout: float | None = None):
+    """Führt `coro` auf dem geteilten Loop aus und wartet blockierend auf das Ergebnis."""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop()).result(timeout)
+
+_ASYNC_CLIENTS = {}
+
+def ensure_async_client(api_key: str):
+    """Ein AsyncOpenAI-Client pro API-Key, mit gepooltem Keep-Alive-HTTP-Client."""
+    with _LOOP_LOCK:
+        client = _ASYNC_CLIENTS.get(api_key)
+        if client is None:
+            # Retries übernimmt call_openai_async (Rate-Limit-Scheduler), nicht das SDK
+            client = _openai().AsyncOpenAI(api_key=api_key, http_client=_pooled_http_client(), max_retries=0)
+            _ASYNC_CLIENTS[api_key] = client
+    return client
 
+def _pooled_http_client():
+    try:
+        import httpx
+        from openai import DefaultAsyncHttpxClient
+        max_conn = int(os.getenv("OPENAI_STYLE_PROMPT_MAX_CONNECTIONS", "32"))
+        return DefaultAsyncHttpxClient(limits=httpx.Limits(max_connections=max_conn,
+                                                           max_keepalive_connections=max_conn,
+                                                           keepalive_expiry=60.0))
+    except Exception:
+        return None  # SDK-Default (ebenfalls gepoolt)
+
+# ----- Request-Layout -----
+# Provider-Prompt-Caching greift nur auf einem byte-identischen Präfix: statische Texte zuerst
+# (System + Brief), variable Felder (Tone, Preset, Addon, Props, Bild) ganz am Ende.
+_SYSTEM_STATIC = (
+    "You are an Image Prompt Generator for generative image models.\n"
+    "STRICT SUBJECTLESS MODE:\n"
+    "- Do NOT introduce people, humans, characters, silhouettes, faces, hands, animals, creatures, or any living beings.\n"
+    "- Focus ONLY on environment/background, lighting, composition, camera, color, mood, textures, materials.\n"
+    "- Use any provided image strictly as environmental context; never infer or add subjects.\n"
+    "Output must be a SINGLE plain text prompt (no code block, no preface).\n"
+)
+_USER_STATIC = (
+    "TASK: Produce a polished, subjectless style/background prompt suitable for image generation. "
+    "No subjects, no portraits, no silhouettes; environment only.\n"
+    "Constraints:\n"
+    "- Do not mention or imply people/animals/characters.\n"
+    "- Avoid brand names/logos/readable text.\n"
+    "- Keep it concise but expressive; 1–2 sentences are fine.\n"
+    "Return only the final prompt line.\n"
+    "The request fields (TONE, DETAIL_LEVEL, PRESET, STYLE_ADDON, PROPS) follow."
+)
+
+@lru_cache(maxsize=None)
 def build_system_msg(language: str) -> str:
-    return (
-        "You are an Image Prompt Generator for generative image models.\n"
-        "STRICT SUBJECTLESS MODE:\n"
-        "- Do NOT introduce people, humans, characters, silhouettes, faces, hands, animals, creatures, or any living beings.\n"
-        "- Focus ONLY on environment/background, lighting, composition, camera, color, mood, textures, materials.\n"
-        "- Use any provided image strictly as environmental context; never infer or add subjects.\n"
-        f"- Respond in language: {language}.\n"
-        "Output must be a SINGLE plain text prompt (no code block, no preface)."
-    )
+    """Statischer System-Text; die Sprache steht als einziges variables Element am Ende."""
+    return sys.intern(f"{_SYSTEM_STATIC}- Respond in language: {language}.")
+
+@lru_cache(maxsize=64)
+def prompt_cache_key(system_msg: str) -> str:
+    """Routing-Hinweis fürs Provider-Caching: gleicher statischer Präfix -> gleicher Key."""
+    return "osp-" + hashlib.sha256((system_msg + _USER_STATIC).encode("utf-8")).hexdigest()[:16]
 
 def build_user_parts(preset_text: str, style_addon: str, props: str,
-                     tone: str, detail: int, image_b64: str | None):
-    parts = []
-    brief = (
-        "TASK: Produce a polished, subjectless style/background prompt suitable for image generation. "
-        "No subjects, no portraits, no silhouettes; environment only.\n"
+                     tone: str, detail: int, image_b64: str | None, image_detail: str = "auto", variants: int = 1):
+    fields = (
         f"TONE: {tone}\nDETAIL_LEVEL: {detail}\n\n"
         f"PRESET:\n{preset_text}\n\n"
         f"STYLE_ADDON:\n{(style_addon or '').strip()}\n\n"
-        f"PROPS (environmental objects only; optional):\n{(props or '').strip()}\n\n"
-        "Constraints:\n"
-        "- Do not mention or imply people/animals/characters.\n"
-        "- Avoid brand names/logos/readable text.\n"
-        "- Keep it concise but expressive; 1–2 sentences are fine.\n"
-        "Return only the final prompt line."
+        f"PROPS (environmental objects only; optional):\n{(props or '').strip()}"
     )
-    parts.append({"type": "input_text", "text": brief})
+    if variants > 1:
+        fields += (f"\n\nVARIANTS: {variants}\nReturn exactly {variants} clearly different alternative prompts, "
+                   "one per line, without numbering, bullets or blank lines.")
+    parts = [{"type": "input_text", "text": _USER_STATIC}, {"type": "input_text", "text": fields}]
     if image_b64:
-        parts.append({"type": "input_image", "image_url": {"url": image_b64}})
+        parts.append({"type": "input_image", "image_url": image_b64, "detail": image_detail})
     return parts
 
 def extract_text(resp) -> str:
@@ -60,8 +132,26 @@ def extract_text(resp) -> str:
             return "\n".join(chunks).strip()
     return ""
 
-def call_openai_once(client, model: str, system_msg: str, user_parts: list, max_tokens: int, temperature: float):
-    resp = client.responses.create(
+_LIST_MARKER = re.compile(r"^\s*(?:[-*•]+|\d+[.):]|\(\d+\))\s*")
+
+def split_variants(text: str) -> List[str]:
+    """Mehrere Kandidaten aus einer Antwort: JSON-Liste/{"variants": [...]} oder eine Zeile pro Kandidat."""
+    text = (text or "").strip()
+    if text[:1] in "[{":
+        try:
+            data = json.loads(text)
+            if isinstance(data, dict):
+                data = data.get("variants") or data.get("prompts") or []
+            if isinstance(data, list):
+                return [str(v).strip() for v in data if str(v).strip()]
+        except ValueError:
+            pass
+    lines = (_LIST_MARKER.sub("", l).strip().strip('"') for l in text.splitlines())
+    return [l for l in lines if l]
+
+def _request_kwargs(model: str, system_msg: str, user_parts: list, max_tokens: int, temperature: float,
+                    timeout: float | None) -> dict:
+    kwargs = dict(
         model=model,
         input=[
             {"role": "system", "content": [{"type": "input_text", "text": system_msg}]},
@@ -69,29 +159,215 @@ def call_openai_once(client, model: str, system_msg: str, user_parts: list, max_
         ],
         max_output_tokens=max_tokens,
         temperature=temperature,
+        extra_body={"prompt_cache_key": prompt_cache_key(system_msg)},
     )
-    return extract_text(resp)
+    if timeout is not None:
+        kwargs["timeout"] = timeout
+    return kwargs
 
-def call_openai(client, model: str, system_msg: str, user_parts: list, max_tokens: int, temperature: float, debug: bool) -> str:
-    delays = [0.0, 1.0, 2.5]
-    last_err = None
+async def _create(client, limiter, kwargs: dict):
+    """responses.create – mit Raw-Response (x-ratelimit-*-Header) wenn der Client sie anbietet."""
+    raw_api = getattr(client.responses, "with_raw_response", None)
+    if raw_api is None:
+        return await client.responses.create(**kwargs)
+    raw = await raw_api.create(**kwargs)
+    limiter.update(raw.headers)
+    parsed = raw.parse()
+    return await parsed if asyncio.iscoroutine(parsed) else parsed
+
+async def call_openai_once_async(client, model: str, system_msg: str, user_parts: list, max_tokens: int, temperature: float,
+                                 timeout: float | None = None):
+    """Ein einzelner Call; aktualisiert die Rate-Limits des Modells aus den x-ratelimit-*-Headern."""
+    limiter = ratelimit.SCHEDULER.limiter(model)
+    resp = await _create(client, limiter, _request_kwargs(model, system_msg, user_parts, max_tokens, temperature, timeout))
+    usage = metrics.record_usage(model, getattr(resp, "usage", None))
+    return extract_text(resp), usage
+
+def _complete_lines(text: str) -> List[str]:
+    """Abgeschlossene (mit \\n beendete), nicht-leere Zeilen."""
+    return [l for l in text.split("\n")[:-1] if l.strip()]
+
+def _cut_at_boundary(text: str, budget: int) -> str:
+    """Auf `budget` Zeichen kürzen, möglichst an einer Satz-/Wortgrenze."""
+    cut = text[:budget]
+    for sep in (";", ",", " "):
+        i = cut.rfind(sep)
+        if i >= budget // 2:
+            return cut[:i]
+    return cut
+
+async def call_openai_stream_async(client, model: str, system_msg: str, user_parts: list, max_tokens: int, temperature: float,
+                                   timeout: float | None = None, stop_lines: int = 1, char_budget: int = 0):
+    """
+    Streaming-Variante von `call_openai_once_async`: liest `response.output_text.delta`-Events und schließt
+    den Stream, sobald `stop_lines` vollständige Zeilen oder `char_budget` Zeichen da sind (0 = aus).
+    Misst die Time-to-first-token; bei frühem Abbruch fehlt `response.completed` -> Usage wird geschätzt.
+    """
+    loop = asyncio.get_running_loop()
+    limiter = ratelimit.SCHEDULER.limiter(model)
+    kwargs = _request_kwargs(model, system_msg, user_parts, max_tokens, temperature, timeout)
+    kwargs["stream"] = True
+    t0 = loop.time()
+    stream = await _create(client, limiter, kwargs)
+    text, usage_obj, stopped = "", None, ""
+    try:
+        async for event in stream:
+            etype = getattr(event, "type", "")
+            if etype == "response.output_text.delta":
+                if not text:
+                    metrics.observe("api_ttft_seconds", loop.time() - t0, model=model)
+                text += getattr(event, "delta", "") or ""
+                if stop_lines and "\n" in text and len(_complete_lines(text)) >= stop_lines:
+                    text, stopped = "\n".join(_complete_lines(text)[:stop_lines]), "line"
+                    break
+                if char_budget and len(text) >= char_budget:
+                    text, stopped = _cut_at_boundary(text, char_budget), "budget"
+                    break
+            elif etype in ("response.completed", "response.incomplete"):
+                usage_obj = getattr(getattr(event, "response", None), "usage", None)
+            elif etype in ("response.failed", "error"):
+                err = getattr(getattr(event, "response", None), "error", None) or event
+                raise RuntimeError(f"stream {etype}: {getattr(err, 'message', '') or err}")
+    finally:
+        close = getattr(stream, "close", None)
+        if close is not None:
+            res = close()
+            if asyncio.iscoroutine(res):
+                await res
+    if stopped:
+        metrics.inc("api_stream_early_stop_total", model=model, reason=stopped)
+    if usage_obj is None:
+        usage_obj = {"input_tokens": ratelimit.estimate_tokens(system_msg, user_parts, 0),
+                     "output_tokens": max(1, len(text) // 4)}
+    return text.strip(), metrics.record_usage(model, usage_obj)
+
+async def call_openai_async(client, model: str, system_msg: str, user_parts: list, max_tokens: int, temperature: float, debug: bool,
+                            deadline_s: float | None = None, stream_opts: dict | None = None) -> str:
+    """
+    Wartet vor jedem Versuch auf das RPM/TPM-Budget des Modells (statt in ein 429 zu laufen).
+    Retry nur bei retrybaren Fehlern: Retry-After bei 429, sonst exponentieller Backoff mit Jitter,
+    alles begrenzt durch `deadline_s` (Default: OPENAI_STYLE_PROMPT_DEADLINE_S).
+    `stream_opts` (stop_lines/char_budget) schaltet auf `call_openai_stream_async` um.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + (deadline_s or DEADLINE_S)
+    est = ratelimit.estimate_tokens(system_msg, user_parts, max_tokens)
     tried_fallback = False
-    for i, d in enumerate(delays):
-        if d > 0: time.sleep(d)
+    attempt = 0
+    while True:
+        attempt += 1
+        ticket = BREAKER.allow()
+        if ticket is None:
+            raise CircuitOpenError("OpenAI circuit open – skipping API call")
+        limiter = ratelimit.SCHEDULER.limiter(model)
+        try:
+            await limiter.acquire(est, deadline)
+        except BaseException:
+            BREAKER.abandon(ticket)  # Warten aufs Rate-Limit sagt nichts über die API aus
+            raise
         try:
-            return call_openai_once(client, model, system_msg, user_parts, max_tokens, temperature)
+            t0 = loop.time()
+            remaining = max(0.001, deadline - loop.time())
+            if stream_opts is not None:
+                once = call_openai_stream_async(client, model, system_msg, user_parts, max_tokens, temperature,
+                                                timeout=remaining, **stream_opts)
+            else:
+                once = call_openai_once_async(client, model, system_msg, user_parts, max_tokens, temperature, timeout=remaining)
+            text, usage = await asyncio.wait_for(once, remaining)
+            metrics.observe("api_latency_seconds", loop.time() - t0, model=model)
+            BREAKER.success(ticket)
+            if usage:
+                limiter.settle(est, usage["input_tokens"] + usage["output_tokens"])
+                if debug: print(f"[OpenAIStylePrompt] usage {model}: input {usage['input_tokens']} "
+                                f"(cached {usage['cached_tokens']}), output {usage['output_tokens']}, ${usage['cost_usd']:.6f}")
+            metrics.inc("api_attempts_total", model=model, result="ok")
+            metrics.inc("api_calls_total", model=model, attempts=attempt)
+            return text
+        except asyncio.CancelledError:
+            BREAKER.abandon(ticket)  # z.B. verlorener Hedge: kein Urteil über die API
+            raise
         except Exception as e:
-            last_err = e
-            msg = str(e)
-            if debug: print(f"[OpenAIStylePrompt] API attempt {i+1}/{len(delays)} failed: {msg}")
-            if (("model" in msg.lower() and "not" in msg.lower() and "available" in msg.lower())
-                or ("access" in msg.lower() and "denied" in msg.lower())
-               ) and not tried_fallback:
+            BREAKER.failure(ticket, e)
+            kind = ratelimit.classify(e)
+            metrics.inc("api_attempts_total", model=model, result=type(e).__name__)
+            limiter.update(getattr(getattr(e, "response", None), "headers", None))
+            if debug: print(f"[OpenAIStylePrompt] API attempt {attempt}/{MAX_ATTEMPTS} failed ({kind}): {e}")
+            if kind == "model_unavailable" and not tried_fallback:
                 if debug: print("[OpenAIStylePrompt] falling back to gpt-4o")
+                metrics.inc("api_model_fallback_total", model=model, to="gpt-4o")
                 model = "gpt-4o"
                 tried_fallback = True
                 continue
-            continue
-    if last_err:
-        raise last_err
-    return ""
+            if kind in ("fatal", "quota", "model_unavailable") or attempt >= MAX_ATTEMPTS:
+                raise
+            delay = ratelimit.retry_after(e) if kind == "rate_limit" else None
+            if delay is None:
+                delay = ratelimit.backoff(attempt)
+            if kind == "rate_limit":
+                limiter.pause(delay)  # alle wartenden Calls dieses Modells halten an
+            if loop.time() + delay > deadline:
+                raise
+            metrics.inc("api_retries_total", model=model, reason=kind)
+            await asyncio.sleep(delay)
+
+def hedge_delay(model: str, hedge_after_s: float = 0.0) -> float:
+    """Explizite Schwelle oder beobachtetes p95 der Einzelcall-Latenz des Modells."""
+    if hedge_after_s and hedge_after_s > 0:
+        return hedge_after_s
+    h = metrics.REGISTRY.histogram("api_latency_seconds", model=model)
+    if h is None or h.count < HEDGE_MIN_SAMPLES:
+        return HEDGE_AFTER_S
+    return h.quantile(0.95) or HEDGE_AFTER_S
+
+async def call_openai_hedged_async(client, model: str, hedge_model: str | None, system_msg: str, user_parts: list,
+                                   max_tokens: int, temperature: float, debug: bool,
+                                   hedge_after_s: float = 0.0, deadline_s: float | None = None,
+                                   stream_opts: dict | None = None) -> tuple:
+    """
+    Latenz-Budget: antwortet `model` nicht innerhalb von `hedge_delay`, läuft parallel ein Request
+    an `hedge_model`; die erste erfolgreiche Antwort gewinnt, der andere Call wird abgebrochen.
+    Nach `deadline_s` -> TimeoutError. Liefert (text, gewinnendes Modell).
+    """
+    loop = asyncio.get_running_loop()
+    budget = deadline_s or DEADLINE_S
+    deadline = loop.time() + budget
+    primary = asyncio.ensure_future(call_openai_async(client, model, system_msg, user_parts, max_tokens, temperature,
+                                                      debug, deadline_s=budget, stream_opts=stream_opts))
+    tasks = {primary: model}
+    try:
+        delay = min(hedge_delay(model, hedge_after_s), budget)
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if not done and hedge_model and hedge_model != model:
+            if debug: print(f"[OpenAIStylePrompt] {model} slower than {delay:.2f}s, hedging with {hedge_model}")
+            metrics.inc("api_hedges_total", model=model, hedge=hedge_model)
+            hedge = asyncio.ensure_future(call_openai_async(client, hedge_model, system_msg, user_parts, max_tokens,
+                                                            temperature, debug, deadline_s=deadline - loop.time(),
+                                                            stream_opts=stream_opts))
+            tasks[hedge] = hedge_model
+        pending = set(tasks)
+        last_err = None
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=max(0.0, deadline - loop.time()),
+                                               return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            for t in done:
+                if t.exception() is None:
+                    metrics.inc("api_hedge_wins_total", model=tasks[t], role="primary" if t is primary else "hedge")
+                    return t.result(), tasks[t]
+                last_err = t.exception()
+        if last_err is not None and not pending:
+            raise last_err
+        metrics.inc("api_deadline_exceeded_total", model=model)
+        raise TimeoutError(f"no answer from {'/'.join(tasks.values())} within {budget:.1f}s")
+    finally:
+        for t in tasks:
+            t.cancel()
+
+def call_openai_once(client, model: str, system_msg: str, user_parts: list, max_tokens: int, temperature: float):
+    """Sync-Wrapper um `call_openai_once_async`; `client` aus `ensure_client`/`ensure_async_client`."""
+    return run_sync(call_openai_once_async(client, model, system_msg, user_parts, max_tokens, temperature))[0]
+
+def call_openai(client, model: str, system_msg: str, user_parts: list, max_tokens: int, temperature: float, debug: bool) -> str:
+    """Sync-Wrapper um `call_openai_async`; `client` aus `ensure_client`/`ensure_async_client`."""
+    return run_sync(call_openai_async(client, model, system_msg, user_parts, max_tokens, temperature, debug))
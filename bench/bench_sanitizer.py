@@ -0,0 +1,112 @@
+# ComfyUI/custom_nodes/openai_style_prompt/bench/bench_sanitizer.py
+# Micro-Benchmark: Single-Pass-Sanitizer vs. frühere Multi-Pass-Implementierung (v1.6).
+#   python bench/bench_sanitizer.py [--repeat 2000]
+import argparse, importlib, json, pathlib, re, sys, timeit
+
+PKG_DIR = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PKG_DIR.parent))
+sanitizer = importlib.import_module(f"{PKG_DIR.name}.sanitizer")
+
+# ----- Referenz: Implementierung vor dem Engine-Umbau -----
+def legacy_format_prompt(s: str) -> str:
+    if not s:
+        return s
+    txt = s.strip()
+    txt = re.sub(r"[–—−]", ";", txt)
+    parts = re.split(r"[;|]", txt)
+    cleaned = []
+    for p in parts:
+        seg = p.strip(" ,.;:").strip()
+        if seg:
+            cleaned.append(seg)
+    seen = set()
+    uniq = []
+    for seg in cleaned:
+        low = seg.lower()
+        if low not in seen:
+            seen.add(low)
+            uniq.append(seg)
+    out = ", ".join(uniq).strip()
+    out = re.sub(r"\s+", " ", out)
+    if not re.search(r"[.!?]$", out):
+        out += "."
+    return out
+
+def legacy_sanitize_subjects(s: str, strength: str, strip_trailing_punct: bool) -> str:
+    out = (s or "").strip()
+    if strength == "off":
+        if strip_trailing_punct:
+            out = re.sub(r"[;,\.\s]+$", "", out).strip()
+        return legacy_format_prompt(out)
+    placeholders = []
+    def _protect(match):
+        placeholders.append(match.group(0))
+        return f"__NEG_BLOCK_{len(placeholders)-1}__"
+    out = re.sub(r"\b(no|without)\b[^\.]*", _protect, out, flags=re.IGNORECASE)
+    tokens = sanitizer.FORBIDDEN_TOKENS_LIGHT if strength == "light" else sanitizer.FORBIDDEN_TOKENS_STRICT
+    for t in tokens:
+        out = re.sub(rf"\b{re.escape(t)}\b", "background", out, flags=re.IGNORECASE)
+    if strength == "strict":
+        for pat in sanitizer.FORBIDDEN_PHRASES_STRICT:
+            out = re.sub(pat, "background", out, flags=re.IGNORECASE)
+        out = re.sub(r"\b(for|with)\s+(a|the)\s+(subject|person|character|model)\b",
+                     "for the background", out, flags=re.IGNORECASE)
+    out = re.sub(r"\b(background)(\s+\1\b)+", r"\1", out, flags=re.IGNORECASE)
+    out = re.sub(r"\s+", " ", out).strip()
+    for i, blk in enumerate(placeholders):
+        out = out.replace(f"__NEG_BLOCK_{i}__", blk)
+    if strip_trailing_punct:
+        out = re.sub(r"[;,\.\s]+$", "", out).strip()
+    return legacy_format_prompt(out)
+
+SENTENCES = [
+    "Wide cinematic view of a rain-soaked alley at dusk; neon signage reflecting in puddles",
+    "a lone figure walks past the shuttered shops — no people in the foreground, only wet asphalt",
+    "soft volumetric haze drifts between fire escapes, with a person silhouette near the far wall",
+    "warm tungsten practicals contrast with cool cyan rim light; without any crowd or animals",
+    "the camera sits at knee height, 35mm lens, shallow depth of field | subtle film grain",
+    "a dog and a cat sleep under the awning while a man and woman argue in the distance",
+    "full-body portrait framing avoided, close-up textures of brick, rust and peeling paint",
+    "layered background depth, background background clutter kept minimal, muted teal-orange palette",
+]
+
+# Deutsch: erwartete Ausgaben (Substantive case-sensitiv; Adjektive/Redewendungen bleiben stehen)
+DE_CASES = [
+    ("Regennasse Gasse in der Dämmerung; eine Person unter der Markise, ohne Hunde oder Katzen. Ganzkörper-Silhouette am Ende der Gasse.",
+     "strict", "Regennasse Gasse in der Dämmerung, eine Hintergrund unter der Markise, ohne Hunde oder Katzen. Hintergrund am Ende der Gasse."),
+    ("junge Birken am Ufer, die jungen Blätter glänzen; Hand in Hand gearbeitete Holzvertäfelung",
+     "strict", "junge Birken am Ufer, die jungen Blätter glänzen, Hand in Hand gearbeitete Holzvertäfelung."),
+    ("Junge Birken im Nebel, ein Mann mit Hund am Steg", "light", "Junge Birken im Nebel, ein Hintergrund mit Hintergrund am Steg."),
+]
+
+def workload(n_sentences: int) -> str:
+    return ". ".join(SENTENCES[i % len(SENTENCES)] for i in range(n_sentences)) + "."
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=2000)
+    args = ap.parse_args()
+    report = []
+    for n in (2, 8, 32):
+        text = workload(n)
+        for strength in ("light", "strict"):
+            new = lambda: sanitizer.sanitize_subjects(text, strength, True)
+            old = lambda: legacy_sanitize_subjects(text, strength, True)
+            t_new = min(timeit.repeat(new, number=args.repeat, repeat=3)) / args.repeat
+            t_old = min(timeit.repeat(old, number=args.repeat, repeat=3)) / args.repeat
+            report.append({"sentences": n, "chars": len(text), "strength": strength,
+                           "legacy_us": round(t_old * 1e6, 1), "engine_us": round(t_new * 1e6, 1),
+                           "speedup": round(t_old / t_new, 2), "identical_output": new() == old()})
+    failed = 0
+    for de, strength, expected in DE_CASES:
+        got = sanitizer.sanitize_subjects(de, strength, True, "de")
+        failed += got != expected
+        report.append({"chars": len(de), "strength": strength, "language": "de",
+                       "engine_us": round(min(timeit.repeat(lambda: sanitizer.sanitize_subjects(de, strength, True, "de"),
+                                                            number=args.repeat, repeat=3)) / args.repeat * 1e6, 1),
+                       "sample": got, "matches_expected": got == expected})
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
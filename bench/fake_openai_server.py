@@ -0,0 +1,185 @@
+# ComfyUI/custom_nodes/openai_style_prompt/bench/fake_openai_server.py
+# Lokaler Stand-in für die OpenAI Responses API (POST /v1/responses) – für Benchmarks ohne Kosten.
+#   python bench/fake_openai_server.py --port 8765 --latency-ms 400 --jitter-ms 150 --error-rate 0.02 --rate-limit-rate 0.05
+# `stream: true` wird als SSE beantwortet (ein output_text.delta pro ~4 Zeichen, `--token-ms` Abstand).
+#   export OPENAI_BASE_URL=http://127.0.0.1:8765/v1
+import argparse, json, random, threading, time, uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PROMPTS = [
+    "Rain-soaked alley at dusk; neon reflections in shallow puddles; soft volumetric haze; 35mm, shallow depth of field",
+    "Open forest clearing with layered foliage depth; low morning sun through mist; moss-covered stones; muted greens",
+    "Minimalist concrete interior; diffuse skylight; long soft shadows; neutral palette; clean architectural lines",
+]
+
+
+class FakeConfig:
+    def __init__(self, latency_ms=300.0, jitter_ms=100.0, error_rate=0.0, rate_limit_rate=0.0,
+                 retry_after_s=1.0, rpm_limit=10000, tpm_limit=2000000, seed=None, token_ms=0.0, extra_lines=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after_s = retry_after_s
+        self.rpm_limit = rpm_limit
+        self.tpm_limit = tpm_limit
+        self.token_ms = token_ms
+        self.extra_lines = extra_lines  # geschwätzige Modelle: weitere Zeilen nach dem eigentlichen Prompt
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "ok": 0, "errors": 0, "rate_limited": 0, "streams_aborted": 0, "by_model": {}}
+
+    def count(self, field: str, model: str = "") -> None:
+        with self.lock:
+            self.stats[field] += 1
+            if model and field == "requests":
+                self.stats["by_model"][model] = self.stats["by_model"].get(model, 0) + 1
+
+    def reset(self) -> None:
+        with self.lock:
+            self.stats = {"requests": 0, "ok": 0, "errors": 0, "rate_limited": 0, "streams_aborted": 0, "by_model": {}}
+
+
+def response_body(model: str, text: str, input_tokens: int, output_tokens: int) -> dict:
+    return {
+        "id": f"resp_{uuid.uuid4().hex}", "object": "response", "created_at": int(time.time()),
+        "status": "completed", "model": model, "error": None, "incomplete_details": None,
+        "instructions": None, "metadata": {}, "parallel_tool_calls": True, "temperature": 0.0,
+        "tool_choice": "auto", "tools": [], "top_p": 1.0,
+        "output": [{
+            "type": "message", "id": f"msg_{uuid.uuid4().hex}", "status": "completed", "role": "assistant",
+            "content": [{"type": "output_text", "text": text, "annotations": []}],
+        }],
+        "usage": {
+            "input_tokens": input_tokens, "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+            "input_tokens_details": {"cached_tokens": 0},
+            "output_tokens_details": {"reasoning_tokens": 0},
+        },
+    }
+
+
+def make_handler(cfg: FakeConfig):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, code: int, body: dict, headers: dict | None = None) -> None:
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _stream(self, model: str, text: str, input_tokens: int, output_tokens: int) -> None:
+            """SSE wie die Responses API: created -> output_text.delta* -> completed."""
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            for k, v in self._ratelimit_headers().items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.close_connection = True
+            body = response_body(model, text, input_tokens, output_tokens)
+            events = [{"type": "response.created", "response": dict(body, status="in_progress", output=[], usage=None)}]
+            events += [{"type": "response.output_text.delta", "item_id": body["output"][0]["id"], "output_index": 0,
+                        "content_index": 0, "delta": text[i:i + 4], "logprobs": []} for i in range(0, len(text), 4)]
+            events.append({"type": "response.completed", "response": body})
+            try:
+                for seq, ev in enumerate(events):
+                    if ev["type"] == "response.output_text.delta" and cfg.token_ms:
+                        time.sleep(cfg.token_ms / 1000.0)
+                    ev["sequence_number"] = seq
+                    self.wfile.write(f"event: {ev['type']}\ndata: {json.dumps(ev)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                cfg.count("streams_aborted")
+
+        def _ratelimit_headers(self) -> dict:
+            return {
+                "x-ratelimit-limit-requests": str(cfg.rpm_limit),
+                "x-ratelimit-remaining-requests": str(max(0, cfg.rpm_limit - cfg.stats["requests"] % cfg.rpm_limit)),
+                "x-ratelimit-reset-requests": "1s",
+                "x-ratelimit-limit-tokens": str(cfg.tpm_limit),
+                "x-ratelimit-remaining-tokens": str(cfg.tpm_limit),
+                "x-ratelimit-reset-tokens": "1s",
+            }
+
+        def do_GET(self):
+            if self.path.rstrip("/") == "/stats":
+                with cfg.lock:
+                    return self._send(200, json.loads(json.dumps(cfg.stats)))
+            self._send(404, {"error": {"message": "not found"}})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                req = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                return self._send(400, {"error": {"message": "invalid json", "type": "invalid_request_error"}})
+            if not self.path.rstrip("/").endswith("/responses"):
+                return self._send(404, {"error": {"message": f"unknown path {self.path}"}})
+            model = str(req.get("model", ""))
+            cfg.count("requests", model)
+            with cfg.lock:
+                roll = cfg.rng.random()
+                delay = max(0.0, cfg.rng.gauss(cfg.latency_ms, cfg.jitter_ms)) / 1000.0
+                text = cfg.rng.choice(PROMPTS)
+                if cfg.extra_lines:
+                    text += "".join("\n" + cfg.rng.choice(PROMPTS) for _ in range(cfg.extra_lines))
+            if roll < cfg.rate_limit_rate:
+                cfg.count("rate_limited")
+                return self._send(429, {"error": {"message": "Rate limit reached (fake)", "type": "requests",
+                                                  "code": "rate_limit_exceeded"}},
+                                  dict(self._ratelimit_headers(), **{"retry-after": f"{cfg.retry_after_s:g}",
+                                                                     "x-ratelimit-remaining-requests": "0"}))
+            time.sleep(delay)
+            if roll < cfg.rate_limit_rate + cfg.error_rate:
+                cfg.count("errors")
+                return self._send(500, {"error": {"message": "Internal server error (fake)", "type": "server_error"}})
+            input_tokens = max(1, len(json.dumps(req.get("input", ""))) // 4)
+            output_tokens = min(int(req.get("max_output_tokens") or 350), max(1, len(text) // 4))
+            cfg.count("ok")
+            if req.get("stream"):
+                return self._stream(model, text, input_tokens, output_tokens)
+            self._send(200, response_body(model, text, input_tokens, output_tokens), self._ratelimit_headers())
+
+    return Handler
+
+
+def start_server(cfg: FakeConfig, host: str = "127.0.0.1", port: int = 0):
+    """Startet den Server in einem Daemon-Thread; -> (server, base_url)."""
+    server = ThreadingHTTPServer((host, port), make_handler(cfg))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-openai", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Fake OpenAI Responses API")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--latency-ms", type=float, default=300.0)
+    ap.add_argument("--jitter-ms", type=float, default=100.0)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--rate-limit-rate", type=float, default=0.0)
+    ap.add_argument("--retry-after", type=float, default=1.0)
+    ap.add_argument("--seed", type=int, default=None)
+    ap.add_argument("--token-ms", type=float, default=0.0, help="Abstand der Stream-Deltas")
+    ap.add_argument("--extra-lines", type=int, default=0, help="zusätzliche Zeilen nach dem Prompt")
+    args = ap.parse_args()
+    cfg = FakeConfig(args.latency_ms, args.jitter_ms, args.error_rate, args.rate_limit_rate, args.retry_after, seed=args.seed,
+                     token_ms=args.token_ms, extra_lines=args.extra_lines)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(cfg))
+    print(f"fake Responses API on http://{args.host}:{args.port}/v1")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+# ComfyUI/custom_nodes/openai_style_prompt/bench/import_time.py
+# Import-Zeit des Pakets per `python -X importtime` (frischer Interpreter pro Lauf).
+#   python bench/import_time.py [--runs 5] [--top 10]
+import argparse, json, pathlib, statistics, subprocess, sys
+
+PKG_DIR = pathlib.Path(__file__).resolve().parent.parent
+HEAVY = ("openai", "PIL", "httpx", "pydantic", "numpy", "torch")
+
+
+def importtime(stmt: str) -> dict:
+    """-> {modul: kumulative Mikrosekunden} für `stmt` in einem frischen Interpreter."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", stmt], cwd=str(PKG_DIR.parent),
+                          capture_output=True, text=True, check=True)
+    out = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        try:
+            _, cum, name = (x.strip() for x in line[len("import time:"):].split("|"))
+            out[name.strip()] = int(cum)
+        except ValueError:
+            continue  # Kopfzeile
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description="OpenAI Style Prompt – Import-Zeit")
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--top", type=int, default=10)
+    args = ap.parse_args()
+    pkg = PKG_DIR.name
+
+    runs = [importtime(f"import {pkg}") for _ in range(args.runs)]
+    total = statistics.median(r.get(pkg, 0) for r in runs) / 1000
+    last = runs[-1]
+    loaded = sorted({m.split(".")[0] for m in last} & set(HEAVY))
+    top = sorted(((v, k) for k, v in last.items() if k != pkg), reverse=True)[:args.top]
+    # Referenz: was die schweren Abhängigkeiten allein kosten würden
+    deferred = {}
+    for mod in ("openai", "PIL.Image"):
+        try:
+            deferred[mod] = round(statistics.median(importtime(f"import {mod}").get(mod, 0)
+                                                    for _ in range(args.runs)) / 1000, 2)
+        except subprocess.CalledProcessError:
+            deferred[mod] = None
+    print(json.dumps({
+        "package": pkg, "runs": args.runs, "package_import_ms": round(total, 2),
+        "heavy_modules_loaded": loaded,
+        "standalone_import_ms": deferred,
+        "top_modules_ms": [{"module": k, "ms": round(v / 1000, 2)} for v, k in top],
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+# ComfyUI/custom_nodes/openai_style_prompt/bench/run_bench.py
+# Offline-Benchmark: treibt Node, API-Layer, DiskCache und Sanitizer gegen den lokalen
+# Fake-Server (bench/fake_openai_server.py) und schreibt einen JSON-Report.
+#   python bench/run_bench.py --out bench_report.json [--baseline old_report.json] [--quick]
+import argparse, importlib, json, os, pathlib, platform, resource, statistics, sys, tempfile, threading, time, tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = pathlib.Path(__file__).resolve().parent
+PKG_DIR = BENCH_DIR.parent
+sys.path.insert(0, str(BENCH_DIR))
+sys.path.insert(0, str(PKG_DIR.parent))
+
+from fake_openai_server import FakeConfig, start_server  # noqa: E402
+
+BASE_INPUTS = dict(
+    model="gpt-4o", preset="Urban Night", style_addon="", props="", language="en", prompt_tone="cinematic",
+    detail_level=4, max_tokens=350, temperature=0.0, template_mode="off", cost_mode="premium",
+    use_cache=True, cache_ttl_days=0, sanitizer_strength="strict", strip_trailing_punctuation=True, debug_log=False,
+)
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    s = sorted(values)
+    k = max(0, min(len(s) - 1, int(round(q * (len(s) - 1)))))
+    return s[k]
+
+
+class Bench:
+    def __init__(self, args):
+        self.args = args
+        self.results = []
+        self.cfg = FakeConfig(args.latency_ms, args.jitter_ms, args.error_rate, args.rate_limit_rate,
+                              args.retry_after, seed=args.seed)
+        self.server, base_url = start_server(self.cfg)
+        self.tmp = tempfile.TemporaryDirectory(prefix="osp_bench_")
+        os.environ["OPENAI_BASE_URL"] = base_url
+        os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+        os.environ["COMFYUI_USER_PATH"] = self.tmp.name
+        self.pkg = importlib.import_module(PKG_DIR.name)
+        self.node_mod = importlib.import_module(f"{PKG_DIR.name}.node")
+        self.api = importlib.import_module(f"{PKG_DIR.name}.api")
+        self.cache = importlib.import_module(f"{PKG_DIR.name}.cache")
+        self.sanitizer = importlib.import_module(f"{PKG_DIR.name}.sanitizer")
+        self.nonce = 0
+
+    def unique(self, tag: str) -> str:
+        self.nonce += 1
+        return f"{tag} variation {self.nonce}"
+
+    # ----- Messung -----
+    def measure(self, name: str, ops, concurrency: int = 1, **meta):
+        """`ops`: Liste von Callables; jede wird einmal ausgeführt und einzeln gemessen.
+        Fehlgeschlagene Ops (z.B. RateLimitError nach allen Retries) zählen als `errors` und
+        gehen nicht in die Latenz-Perzentile ein, sondern in `error_p50_ms`."""
+        self.cfg.reset()
+        latencies, failed, error_types = [], [], {}
+        lock = threading.Lock()
+        if self.args.trace_memory:
+            tracemalloc.start()
+
+        def timed(fn):
+            t0 = time.perf_counter()
+            try:
+                fn()
+            except Exception as e:
+                dt = time.perf_counter() - t0
+                with lock:
+                    failed.append(dt)
+                    error_types[type(e).__name__] = error_types.get(type(e).__name__, 0) + 1
+                return
+            dt = time.perf_counter() - t0
+            with lock:
+                latencies.append(dt)
+
+        t0 = time.perf_counter()
+        if concurrency <= 1:
+            for fn in ops:
+                timed(fn)
+        else:
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                list(pool.map(timed, ops))
+        wall = time.perf_counter() - t0
+        peak = None
+        if self.args.trace_memory:
+            peak = tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.stop()
+        stats = json.loads(json.dumps(self.cfg.stats))
+        ms = lambda v: round(v * 1000, 3) if v is not None else None
+        row = {
+            "scenario": name, "ops": len(ops), "concurrency": concurrency, "wall_s": round(wall, 4),
+            "throughput_ops_s": round(len(ops) / wall, 2) if wall else None,
+            "p50_ms": ms(statistics.median(latencies)) if latencies else None,
+            "p95_ms": ms(percentile(latencies, 0.95)),
+            "p99_ms": ms(percentile(latencies, 0.99)),
+            "errors": len(failed), "error_rate": round(len(failed) / len(ops), 4) if ops else 0.0,
+            "error_types": error_types, "error_p50_ms": ms(statistics.median(failed)) if failed else None,
+            "server_requests": stats["requests"],
+            "calls_per_request": round(stats["requests"] / len(ops), 3),
+            "rate_limited": stats["rate_limited"], "server_errors": stats["errors"],
+            "peak_traced_mb": round(peak, 2) if peak is not None else None,
+            "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            **meta,
+        }
+        self.results.append(row)
+        p50, p95 = (f"{row[k]:>9.3f}" if row[k] is not None else f"{'-':>9}" for k in ("p50_ms", "p95_ms"))
+        print(f"  {name:<32} p50 {p50} ms  p95 {p95} ms  "
+              f"calls/req {row['calls_per_request']:.2f}  errors {row['errors']}  wall {row['wall_s']:.2f}s", file=sys.stderr)
+        return row
+
+    def node_run(self, node, **overrides):
+        return lambda: node.run(**dict(BASE_INPUTS, **overrides))
+
+    # ----- Szenarien -----
+    def run(self):
+        n = self.args.n
+        conc = self.args.concurrency
+        Node = self.node_mod.OpenAIStylePrompt
+        node = Node()
+
+        text = ". ".join(["Rain-soaked alley at dusk with a person under the awning; neon reflections",
+                          "no people in the foreground, only wet asphalt — full-body shots avoided"] * 8)
+        self.measure("sanitize_strict_16_sentences",
+                     [lambda: self.sanitizer.sanitize_subjects(text, "strict", True)] * (n * 20))
+
+        dc = self.cache.DiskCache(pathlib.Path(self.tmp.name) / "bench_disk")
+        keys = [f"{i:064x}" for i in range(n * 20)]
+        self.measure("disk_cache_put", [lambda k=k: dc.put(k, text) for k in keys])
+        self.measure("disk_cache_get_hit", [lambda k=k: dc.get(k) for k in keys])
+        self.measure("disk_cache_get_miss", [lambda k=k: dc.get("f" + k[1:]) for k in keys])
+
+        client = node.client
+        sys_msg = self.api.build_system_msg("en")
+        parts = self.api.build_user_parts("Urban night", "", "", "cinematic", 3, None)
+        self.measure("api_call_openai_serial",
+                     [lambda: self.api.call_openai(client, "gpt-4o", sys_msg, parts, 350, 0.0, False)] * n)
+
+        cold = [self.unique("text") for _ in range(n)]
+        self.measure("node_text_cold_serial", [self.node_run(node, style_addon=s) for s in cold])
+        self.measure("node_text_warm_lru_serial", [self.node_run(node, style_addon=s) for s in cold])
+        self.cache.LRU_MEM.clear()
+        self.measure("node_text_warm_disk_serial", [self.node_run(node, style_addon=s) for s in cold])
+
+        cold_c = [self.unique("conc") for _ in range(n * 2)]
+        self.measure("node_text_cold_concurrent", [self.node_run(node, style_addon=s) for s in cold_c], conc)
+        dup = self.unique("dup")
+        self.measure("node_text_duplicate_concurrent", [self.node_run(node, style_addon=dup)] * (n * 2), conc)
+
+        try:
+            import numpy as np
+        except Exception:
+            np = None
+        if np is not None:
+            rng = np.random.default_rng(self.args.seed or 0)
+            side = self.args.image_side
+            frames = [rng.random((1, side, side, 3), dtype=np.float32) for _ in range(max(2, n // 2))]
+            # Frame -> Upload-Größe: Host-Downsampling gegen den alten Weg (volle uint8-Kopie + PIL-BOX-Thumbnail)
+            utils = importlib.import_module(f"{PKG_DIR.name}.utils")
+            Image = utils.pil_image()
+            big = rng.random((side * 2, side * 32 // 9, 3), dtype=np.float32)
+            if Image is not None:
+                def pil_box():
+                    im = Image.fromarray(np.clip(big * 255, 0, 255).astype(np.uint8))
+                    im.thumbnail((side, side), Image.BOX)
+                old = self.measure("frame_downscale_pil_box", [pil_box] * n, frame=list(big.shape[:2]), image_side=side)
+                new = self.measure("frame_downscale_host", [lambda: utils._frame_u8_host(big, side)] * n,
+                                   frame=list(big.shape[:2]), image_side=side)
+                if old["p50_ms"] and new["p50_ms"]:
+                    new["speedup_vs_pil_box"] = round(old["p50_ms"] / new["p50_ms"], 2)
+                    if new["speedup_vs_pil_box"] < 1.0:
+                        print(f"  WARNING frame_downscale_host slower than PIL BOX ({new['speedup_vs_pil_box']}x)", file=sys.stderr)
+            self.measure("node_vision_cold_serial", [self.node_run(node, image=f) for f in frames], image_side=side)
+            self.measure("node_vision_warm_serial", [self.node_run(node, image=f) for f in frames], image_side=side)
+            batch = np.concatenate(frames[:8])
+            bnode = self.node_mod.OpenAIStylePromptBatch()
+            self.measure("batch_node_cold", [lambda: bnode.run_batch(batch, conc, **dict(BASE_INPUTS, style_addon=self.unique("batch")))],
+                         frames=len(batch))
+
+        mnode = self.node_mod.OpenAIStylePromptMulti()
+        multi_inputs = {k: v for k, v in BASE_INPUTS.items() if k not in ("preset", "style_addon", "prompt_tone", "language")}
+        presets = "\n".join(list(self.node_mod.PRESETS)[:5])
+        self.measure("multi_node_cold_40_combos",
+                     [lambda: mnode.run_multi(presets, self.unique("multi") + "\nsecond addon", "cinematic, photography",
+                                              "de, en", conc, **multi_inputs)], combos=40)
+        return self.report()
+
+    def report(self):
+        return {
+            "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "fake_server": {"latency_ms": self.args.latency_ms, "jitter_ms": self.args.jitter_ms,
+                            "error_rate": self.args.error_rate, "rate_limit_rate": self.args.rate_limit_rate},
+            "results": self.results,
+        }
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+    """Regressionen gegenüber einem früheren Report (p95, calls/request, Speicher)."""
+    old = {r["scenario"]: r for r in baseline.get("results", [])}
+    regressions = []
+    for r in report["results"]:
+        b = old.get(r["scenario"])
+        if not b:
+            continue
+        for field in ("p95_ms", "calls_per_request", "peak_traced_mb"):
+            new_v, old_v = r.get(field), b.get(field)
+            if new_v is None or old_v is None or old_v <= 0:
+                continue
+            if new_v > old_v * (1 + tolerance):
+                regressions.append({"scenario": r["scenario"], "metric": field, "baseline": old_v, "current": new_v})
+    return regressions
+
+
+def main():
+    ap = argparse.ArgumentParser(description="OpenAI Style Prompt – Offline-Benchmark")
+    ap.add_argument("--n", type=int, default=20, help="Basisanzahl Requests pro Szenario")
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--image-side", type=int, default=1024)
+    ap.add_argument("--latency-ms", type=float, default=250.0)
+    ap.add_argument("--jitter-ms", type=float, default=75.0)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--rate-limit-rate", type=float, default=0.0)
+    ap.add_argument("--retry-after", type=float, default=0.2)
+    ap.add_argument("--seed", type=int, default=1234)
+    ap.add_argument("--trace-memory", action="store_true", help="tracemalloc-Peak pro Szenario (verlangsamt)")
+    ap.add_argument("--quick", action="store_true", help="kleine Werte für einen Smoke-Run")
+    ap.add_argument("--out", default="")
+    ap.add_argument("--baseline", default="")
+    ap.add_argument("--tolerance", type=float, default=0.2)
+    args = ap.parse_args()
+    if args.quick:
+        args.n, args.latency_ms, args.jitter_ms, args.image_side = 4, 20.0, 5.0, 256
+
+    report = Bench(args).run()
+    if args.baseline:
+        report["regressions"] = compare(report, json.loads(pathlib.Path(args.baseline).read_text()), args.tolerance)
+    text = json.dumps(report, indent=2)
+    if args.out:
+        pathlib.Path(args.out).write_text(text, encoding="utf-8")
+    print(text)
+    if report.get("regressions"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
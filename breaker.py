@@ -0,0 +1,133 @@
+# ComfyUI/custom_nodes/openai_style_prompt/breaker.py
+# Prozessweiter Circuit-Breaker für den OpenAI-Pfad: closed -> open -> half-open (ein Probe-Call)
+import os, threading, time
+from collections import deque
+from typing import Optional
+
+from . import metrics
+from .ratelimit import classify, is_transport_error
+
+
+class CircuitOpenError(RuntimeError):
+    """Der Breaker ist offen: kein API-Call, direkt zum Template-Fallback."""
+
+
+def failure_class(exc: BaseException) -> Optional[str]:
+    """
+    'auth'   – Key/Quota-Problem (401/403/insufficient_quota): öffnet sofort
+    'outage' – 5xx, Timeouts, Verbindungsfehler: zählt zur Fehlerquote
+    None     – zählt nicht (429 regelt der Scheduler, 4xx/Modell-Fehler sind Request-Probleme,
+               lokale Fehler wie TypeError sind Bugs und sollen sichtbar bleiben)
+    """
+    status = getattr(exc, "status_code", None)
+    if classify(exc) == "quota" or status in (401, 403):
+        return "auth"
+    if (isinstance(status, int) and status >= 500) or is_transport_error(exc):
+        return "outage"
+    return None
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, window_sec: float = 60.0, min_calls: int = 5, failure_rate: float = 0.5,
+                 open_sec: float = 30.0, max_open_sec: float = 300.0):
+        self.window_sec = window_sec
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.base_open_sec = open_sec
+        self.max_open_sec = max_open_sec
+        self.open_sec = open_sec
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self._events: "deque[tuple]" = deque()  # (zeit, ok)
+        self._probe = False
+        self._lock = threading.Lock()
+
+    def _set(self, state: str, reason: str = "") -> None:
+        if state != self.state:
+            metrics.inc("circuit_transitions_total", to=state, reason=reason or "-")
+        self.state = state
+
+    def _trip(self, reason: str, now: float) -> None:
+        self.opened_at = now
+        self._probe = False
+        self._set(self.OPEN, reason)
+
+    def is_open(self) -> bool:
+        """Offen und noch nicht reif für den Probe-Call (ohne Seiteneffekt)."""
+        with self._lock:
+            return self.state == self.OPEN and time.monotonic() - self.opened_at < self.open_sec
+
+    def allow(self) -> Optional[str]:
+        """None = abgelehnt; 'call' = normaler Call; 'probe' = einziger Test-Call im Half-Open-Zustand."""
+        now = time.monotonic()
+        with self._lock:
+            if self.state == self.CLOSED:
+                return "call"
+            if self.state == self.OPEN and now - self.opened_at >= self.open_sec:
+                self._set(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN and not self._probe:
+                self._probe = True
+                return "probe"
+            metrics.inc("circuit_rejected_total")
+            return None
+
+    def success(self, ticket: Optional[str]) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if ticket == "probe" or self.state == self.HALF_OPEN:
+                self._events.clear()
+                self._probe = False
+                self.open_sec = self.base_open_sec
+                self._set(self.CLOSED, "probe_ok")
+            self._push(now, True)
+
+    def failure(self, ticket: Optional[str], exc: BaseException) -> None:
+        cls = failure_class(exc)
+        if cls is None:
+            if ticket == "probe":
+                self.abandon(ticket)
+            return
+        now = time.monotonic()
+        with self._lock:
+            if ticket == "probe" or self.state == self.HALF_OPEN:
+                self.open_sec = min(self.max_open_sec, self.open_sec * 2)
+                self._trip("probe_failed", now)
+                return
+            self._push(now, False)
+            if self.state != self.CLOSED:
+                return
+            if cls == "auth":
+                self._trip("auth", now)
+                return
+            fails = sum(1 for _, ok in self._events if not ok)
+            if len(self._events) >= self.min_calls and fails / len(self._events) >= self.failure_rate:
+                self._trip("failure_rate", now)
+
+    def abandon(self, ticket: Optional[str]) -> None:
+        """Probe ohne Ergebnis (abgebrochen/neutral): nächster Aufrufer darf erneut proben."""
+        if ticket != "probe":
+            return
+        with self._lock:
+            self._probe = False
+
+    def _push(self, now: float, ok: bool) -> None:
+        self._events.append((now, ok))
+        while self._events and now - self._events[0][0] > self.window_sec:
+            self._events.popleft()
+
+    def stats(self) -> dict:
+        with self._lock:
+            fails = sum(1 for _, ok in self._events if not ok)
+            return {"state": {self.CLOSED: 0, self.HALF_OPEN: 1, self.OPEN: 2}[self.state],
+                    "window_calls": len(self._events), "window_failures": fails, "open_seconds": self.open_sec}
+
+
+BREAKER = CircuitBreaker(
+    window_sec=float(os.getenv("OPENAI_STYLE_PROMPT_BREAKER_WINDOW_S", "60")),
+    min_calls=int(os.getenv("OPENAI_STYLE_PROMPT_BREAKER_MIN_CALLS", "5")),
+    failure_rate=float(os.getenv("OPENAI_STYLE_PROMPT_BREAKER_FAILURE_RATE", "0.5")),
+    open_sec=float(os.getenv("OPENAI_STYLE_PROMPT_BREAKER_OPEN_S", "30")),
+)
+metrics.REGISTRY.register_collector(lambda: {f"circuit_{k}": v for k, v in BREAKER.stats().items()})
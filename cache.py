@@ -1,36 +1,211 @@
 # ComfyUI/custom_nodes/openai_style_prompt/cache.py
-import json, pathlib, time, hashlib, re
+import asyncio, json, os, pathlib, sqlite3, threading, time, hashlib, re
 from collections import OrderedDict
-from typing import Optional
+from typing import Awaitable, Callable, Dict, Optional, Tuple
 
 NODE_VERSION = "v1.6"
-_LRU_CAPACITY = 256
+_LRU_CAPACITY = int(os.getenv("OPENAI_STYLE_PROMPT_LRU_CAPACITY", "256"))
+_LRU_MAX_BYTES = int(float(os.getenv("OPENAI_STYLE_PROMPT_LRU_MAX_MB", "8")) * 1024 * 1024)
 
 def _norm(s: str) -> str:
     return re.sub(r"\s+", " ", (s or "").strip().lower())
 
-class LRU(OrderedDict):
-    def __init__(self, capacity=_LRU_CAPACITY):
-        super().__init__()
+class LRU:
+    """Thread-sicherer In-Memory-LRU, begrenzt nach Anzahl UND Bytes, mit Hit/Miss/Eviction-Zählern."""
+    def __init__(self, capacity=_LRU_CAPACITY, max_bytes=_LRU_MAX_BYTES):
         self.capacity = capacity
+        self.max_bytes = max_bytes
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = 0
+
+    @staticmethod
+    def _size(key: str, value: str) -> int:
+        return len(key) + len(value.encode("utf-8"))
+
+    def __len__(self):
+        return len(self._data)
+
     def get(self, key):
-        if key in self:
-            self.move_to_end(key)
-            return super().get(key)
-        return None
-    def put(self, key, value):
-        self[key] = value
-        self.move_to_end(key)
-        if len(self) > self.capacity:
-            self.popitem(last=False)
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[2] and item[2] < time.monotonic():
+                del self._data[key]
+                self.bytes -= item[1]
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def is_transient(self, key) -> bool:
+        """True, wenn der Eintrag mit TTL (z.B. als Fallback) abgelegt wurde."""
+        with self._lock:
+            item = self._data.get(key)
+            return bool(item and item[2])
+
+    def __contains__(self, key) -> bool:
+        """Ohne Hit/Miss-Zählung und ohne LRU-Reihenfolge zu ändern."""
+        with self._lock:
+            return key in self._data
+
+    def put(self, key, value, ttl: Optional[float] = None):
+        """`ttl` in Sekunden: Eintrag verfällt danach (kurzlebige Werte wie Fallbacks); None = bis zur Eviction."""
+        size = self._size(key, value)
+        expires = time.monotonic() + ttl if ttl else 0.0
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            if self.max_bytes and size > self.max_bytes:
+                return
+            self._data[key] = (value, size, expires)
+            self.bytes += size
+            while self._data and (len(self._data) > self.capacity
+                                  or (self.max_bytes and self.bytes > self.max_bytes)):
+                _, (_, evicted, _) = self._data.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self._data), "bytes": self.bytes, "capacity": self.capacity,
+                    "max_bytes": self.max_bytes, "hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions, "hit_rate": (self.hits / lookups) if lookups else 0.0}
 
 LRU_MEM = LRU()
 
 def lru_get(key: str) -> Optional[str]:
     return LRU_MEM.get(key)
 
-def lru_put(key: str, value: str) -> None:
-    LRU_MEM.put(key, value)
+def lru_put(key: str, value: str, ttl: Optional[float] = None) -> None:
+    LRU_MEM.put(key, value, ttl)
+
+def lru_stats() -> dict:
+    return LRU_MEM.stats()
+
+class BKTree:
+    """BK-Tree über 64-bit-Bildhashes mit Hamming-Distanz."""
+    def __init__(self):
+        self.root = None  # Knoten: [hash, value, {distanz: kind}]
+        self.size = 0
+
+    def add(self, h: int, value: str) -> None:
+        if self.root is None:
+            self.root = [h, value, {}]
+            self.size = 1
+            return
+        node = self.root
+        while True:
+            d = (node[0] ^ h).bit_count()
+            if d == 0:
+                node[1] = value
+                return
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [h, value, {}]
+                self.size += 1
+                return
+            node = child
+
+    def nearest(self, h: int, max_dist: int):
+        """-> (value, distanz) des nächsten Hashes mit Distanz <= max_dist, sonst (None, None)."""
+        best, best_d = None, max_dist + 1
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            d = (node[0] ^ h).bit_count()
+            if d < best_d:
+                best, best_d = node[1], d
+                if d == 0:
+                    break
+            r = best_d - 1
+            stack.extend(c for k, c in node[2].items() if d - r <= k <= d + r)
+        return (best, best_d) if best is not None else (None, None)
+
+class NearDupIndex:
+    """Near-Duplicate-Index für Vision-Requests: pro Satz Nicht-Bild-Parameter (`base`)
+    ein BK-Tree von Bildhash -> vollständiger Cache-Key."""
+    def __init__(self, max_entries: int = 65536):
+        self.max_entries = max_entries
+        self._trees: Dict[str, BKTree] = {}
+        self._lock = threading.Lock()
+        self._size = 0
+        self.near_hits = 0
+
+    def add(self, base: str, h: Optional[int], key: str) -> None:
+        if h is None:
+            return
+        with self._lock:
+            if self._size >= self.max_entries:
+                self._trees.clear()  # simpel begrenzt; füllt sich über neue Hits wieder
+                self._size = 0
+            tree = self._trees.setdefault(base, BKTree())
+            before = tree.size
+            tree.add(h, key)
+            self._size += tree.size - before
+
+    def find(self, base: str, h: Optional[int], max_dist: int):
+        if h is None or max_dist <= 0:
+            return None, None
+        with self._lock:
+            tree = self._trees.get(base)
+            return tree.nearest(h, max_dist) if tree else (None, None)
+
+    def record_hit(self) -> None:
+        with self._lock:
+            self.near_hits += 1
+
+NEAR_INDEX = NearDupIndex()
+
+class SingleFlight:
+    """In-Process-Koaleszierung: gleichzeitige Requests mit identischem Cache-Key teilen sich
+    einen API-Call (Ergebnis oder Fehler). Läuft auf dem geteilten Event-Loop, daher ohne Lock."""
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def in_flight(self) -> int:
+        return len(self._inflight)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[str]]) -> str:
+        fut = self._inflight.get(key)
+        if fut is not None:
+            self.coalesced += 1
+            return await asyncio.shield(fut)
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        self.leaders += 1
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            fut.cancel()
+            raise
+        except BaseException as e:
+            fut.set_exception(e)
+            fut.exception()  # als abgerufen markieren, falls niemand wartet
+            raise
+        else:
+            fut.set_result(result)
+            return result
+        finally:
+            self._inflight.pop(key, None)
+
+SINGLE_FLIGHT = SingleFlight()
+
+def singleflight_stats() -> dict:
+    return {"leaders": SINGLE_FLIGHT.leaders, "coalesced": SINGLE_FLIGHT.coalesced,
+            "in_flight": SINGLE_FLIGHT.in_flight()}
 
 def cache_key(model, language, preset_text, style_addon, props, tone, detail, vhash, sanitizer_strength, node_ver=NODE_VERSION, extra=""):
     raw = "|".join([
@@ -41,30 +216,182 @@ def cache_key(model, language, preset_text, style_addon, props, tone, detail, vh
     return hashlib.sha256(raw.encode("utf-8")).hexdigest()
 
 class DiskCache:
-    def __init__(self, base_dir: pathlib.Path):
-        self.base_dir = base_dir
-        self.base_dir.mkdir(parents=True, exist_ok=True)
+    """
+    Disk-Cache als eine SQLite-Datei (WAL) statt einer JSON-Datei pro Key:
+    atomare Writes, indizierter TTL-Ablauf, Größenbudget mit LRU/LFU-Eviction
+    und `compact()`. Alte `<key>.json`-Dateien werden beim ersten Öffnen einmalig übernommen.
+    """
+    DB_NAME = "cache.sqlite3"
+    EVICT_EVERY = 64
 
-    def path(self, key: str) -> pathlib.Path:
-        return self.base_dir / f"{key}.json"
+    def __init__(self, base_dir: pathlib.Path, max_bytes: Optional[int] = None, eviction: Optional[str] = None):
+        self.base_dir = pathlib.Path(base_dir)
+        self.base_dir.mkdir(parents=True, exist_ok=True)
+        if max_bytes is None:
+            max_bytes = int(float(os.getenv("OPENAI_STYLE_PROMPT_DISK_CACHE_MAX_MB", "256")) * 1024 * 1024)
+        self.max_bytes = max_bytes
+        self.eviction = (eviction or os.getenv("OPENAI_STYLE_PROMPT_DISK_CACHE_EVICTION", "lru")).lower()
+        self._lock = threading.Lock()
+        self._puts = 0
+        self._conn = sqlite3.connect(str(self.base_dir / self.DB_NAME), timeout=10.0,
+                                     isolation_level=None, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key      TEXT PRIMARY KEY,
+                    prompt   TEXT NOT NULL,
+                    created  REAL NOT NULL,
+                    accessed REAL NOT NULL,
+                    hits     INTEGER NOT NULL DEFAULT 0,
+                    size     INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_entries_created  ON entries(created);
+                CREATE INDEX IF NOT EXISTS idx_entries_accessed ON entries(accessed);
+                CREATE TABLE IF NOT EXISTS meta (k TEXT PRIMARY KEY, v TEXT);
+            """)
+        self.migrate_json()
 
     def get(self, key: str, max_age_sec: Optional[int]=None) -> Optional[str]:
-        p = self.path(key)
-        if not p.exists(): return None
-        if max_age_sec is not None:
-            try:
-                if time.time() - p.stat().st_mtime > max_age_sec:
-                    return None
-            except Exception:
-                return None
+        hit = self.lookup(key, max_age_sec)
+        return hit[0] if hit else None
+
+    def lookup(self, key: str, max_age_sec: Optional[int]=None) -> Optional[Tuple[str, float]]:
+        """-> (prompt, Alter in Sekunden) oder None; für Stale-while-revalidate."""
+        now = time.time()
         try:
-            data = json.loads(p.read_text(encoding="utf-8"))
-            return data.get("prompt")
-        except Exception:
+            with self._lock:
+                row = self._conn.execute("SELECT prompt, created FROM entries WHERE key=?", (key,)).fetchone()
+                if row is None:
+                    return None
+                if max_age_sec is not None and now - row[1] > max_age_sec:
+                    return None
+                self._conn.execute("UPDATE entries SET accessed=?, hits=hits+1 WHERE key=?", (now, key))
+            return row[0], max(0.0, now - row[1])
+        except sqlite3.Error:
             return None
 
-    def put(self, key: str, prompt: str) -> None:
+    def put(self, key: str, prompt: str, created: Optional[float] = None) -> None:
+        """`created`: ursprünglicher Erzeugungszeitpunkt (z.B. eines Remote-Eintrags), damit die TTL nicht neu startet."""
+        now = time.time()
         try:
-            self.path(key).write_text(json.dumps({"prompt": prompt}, ensure_ascii=False), encoding="utf-8")
-        except Exception:
+            with self._lock:
+                # Upsert statt INSERT OR REPLACE: `hits` (LFU-Eviction) übersteht Refreshes des Keys
+                self._conn.execute(
+                    "INSERT INTO entries(key, prompt, created, accessed, hits, size) VALUES (?,?,?,?,0,?) "
+                    "ON CONFLICT(key) DO UPDATE SET prompt=excluded.prompt, created=excluded.created, "
+                    "accessed=excluded.accessed, size=excluded.size",
+                    (key, prompt, now if created is None else min(created, now), now, len(key) + len(prompt.encode("utf-8"))))
+                self._puts += 1
+                if self._puts % self.EVICT_EVERY == 0:
+                    self._evict_locked()
+        except sqlite3.Error:
             pass
+
+    # ----- Wartung -----
+    def _evict_locked(self) -> int:
+        if not self.max_bytes or self.max_bytes <= 0:
+            return 0
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return 0
+        target = total - int(self.max_bytes * 0.9)  # etwas Luft, damit nicht bei jedem Put evictet wird
+        order = "hits ASC, accessed ASC" if self.eviction == "lfu" else "accessed ASC"
+        removed, freed = [], 0
+        for key, size in self._conn.execute(f"SELECT key, size FROM entries ORDER BY {order}"):
+            removed.append((key,))
+            freed += size
+            if freed >= target:
+                break
+        self._conn.executemany("DELETE FROM entries WHERE key=?", removed)
+        return len(removed)
+
+    def purge_expired(self, max_age_sec: int) -> int:
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM entries WHERE created < ?", (time.time() - max_age_sec,))
+            return cur.rowcount
+
+    def compact(self, max_age_sec: Optional[int] = None) -> dict:
+        """Abgelaufene Einträge löschen, Budget durchsetzen, Datei verkleinern (VACUUM)."""
+        expired = self.purge_expired(max_age_sec) if max_age_sec else 0
+        with self._lock:
+            evicted = self._evict_locked()
+            self._conn.execute("VACUUM")
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return dict(self.stats(), expired=expired, evicted=evicted)
+
+    def stats(self) -> dict:
+        with self._lock:
+            n, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        db = self.base_dir / self.DB_NAME
+        return {"entries": n, "bytes": total, "max_bytes": self.max_bytes,
+                "file_bytes": db.stat().st_size if db.exists() else 0}
+
+    def migrate_json(self, batch: int = 1000, force: bool = False) -> int:
+        """Einmalige Übernahme der alten `<sha256>.json`-Dateien (mtime wird zu `created`)."""
+        with self._lock:
+            if not force and self._conn.execute("SELECT v FROM meta WHERE k='json_migrated'").fetchone():
+                return 0
+        moved, rows, files = 0, [], []
+
+        def flush():
+            with self._lock:
+                self._conn.execute("BEGIN")
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO entries(key, prompt, created, accessed, hits, size) VALUES (?,?,?,?,0,?)", rows)
+                self._conn.execute("COMMIT")
+            for f in files:
+                try: f.unlink()
+                except OSError: pass
+            rows.clear(); files.clear()
+
+        for p in self.base_dir.glob("*.json"):
+            try:
+                prompt = json.loads(p.read_text(encoding="utf-8")).get("prompt")
+                mtime = p.stat().st_mtime
+            except Exception:
+                continue
+            if prompt:
+                rows.append((p.stem, prompt, mtime, mtime, len(p.stem) + len(prompt.encode("utf-8"))))
+            files.append(p)
+            moved += 1
+            if len(files) >= batch:
+                flush()
+        if files:
+            flush()
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO meta(k, v) VALUES ('json_migrated', ?)", (str(time.time()),))
+        return moved
+
+
+def default_cache_dir() -> pathlib.Path:
+    return pathlib.Path(os.getenv("COMFYUI_USER_PATH", "ComfyUI/user")) / "openai_style_prompt_cache"
+
+_SHARED_CACHES = {}
+_SHARED_LOCK = threading.Lock()
+
+def shared_disk_cache(directory=None) -> "DiskCache":
+    """Eine DiskCache-Instanz pro Verzeichnis für alle Nodes; angelegt (inkl. mkdir) erst beim ersten Zugriff."""
+    path = pathlib.Path(directory) if directory else default_cache_dir()
+    with _SHARED_LOCK:
+        dc = _SHARED_CACHES.get(path)
+        if dc is None:
+            dc = _SHARED_CACHES[path] = DiskCache(path)
+    return dc
+
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="OpenAI Style Prompt – Disk-Cache Wartung")
+    ap.add_argument("command", choices=["stats", "compact", "migrate"])
+    ap.add_argument("--dir", default=str(default_cache_dir()))
+    ap.add_argument("--max-age-days", type=float, default=0, help="compact: ältere Einträge löschen")
+    args = ap.parse_args()
+    dc = DiskCache(pathlib.Path(args.dir))
+    if args.command == "compact":
+        print(json.dumps(dc.compact(int(args.max_age_days * 86400) or None)))
+    elif args.command == "migrate":
+        print(json.dumps({"migrated": dc.migrate_json(force=True)}))
+    else:
+        print(json.dumps(dc.stats()))
@@ -0,0 +1,214 @@
+# ComfyUI/custom_nodes/openai_style_prompt/metrics.py
+# Stage-Latenzen, Zähler und Kosten – als Prometheus-Text und JSON-Snapshot
+import math, threading, time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+PREFIX = "openai_style_prompt"
+
+
+def _num(v) -> str:
+    """Prometheus-Wert ohne Rundung: Ganzzahlen exakt, sonst repr (kein `:g` – 6 Stellen reichen für Zähler nicht)."""
+    f = float(v)
+    if math.isnan(f):
+        return "NaN"
+    if math.isinf(f):
+        return "+Inf" if f > 0 else "-Inf"
+    return str(int(f)) if f.is_integer() else repr(f)
+
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# USD pro 1M Tokens: (input, cached input, output) – Schätzwerte, bei Bedarf anpassen
+MODEL_PRICES = {
+    "gpt-5":         (1.25, 0.125, 10.0),
+    "gpt-5-mini":    (0.25, 0.025, 2.0),
+    "gpt-5-nano":    (0.05, 0.005, 0.40),
+    "gpt-4o":        (2.50, 1.25, 10.0),
+    "gpt-4o-mini":   (0.15, 0.075, 0.60),
+    "gpt-4.1":       (2.00, 0.50, 8.0),
+    "gpt-4.1-mini":  (0.40, 0.10, 1.60),
+    "gpt-4-turbo":   (10.0, 10.0, 30.0),
+    "gpt-4":         (30.0, 30.0, 60.0),
+    "gpt-3.5-turbo": (0.50, 0.50, 1.50),
+    "o1-preview":    (15.0, 7.50, 60.0),
+    "o1-mini":       (3.00, 1.50, 12.0),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # letzter Slot: +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, v: float) -> None:
+        i = 0
+        while i < len(self.buckets) and v > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.sum += v
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Schätzung per linearer Interpolation innerhalb des Buckets (wie histogram_quantile)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        cum = 0
+        for i, c in enumerate(self.counts):
+            if cum + c >= rank and c:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lo = self.buckets[i - 1] if i else 0.0
+                return lo + (self.buckets[i] - lo) * (rank - cum) / c
+            cum += c
+        return self.buckets[-1]
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self.collectors: List[Callable[[], Dict[str, float]]] = []
+
+    @staticmethod
+    def _labels(labels: dict) -> Labels:
+        return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name: str, value: float = 1.0, **labels) -> None:
+        k = (name, self._labels(labels))
+        with self._lock:
+            self.counters[k] = self.counters.get(k, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        k = (name, self._labels(labels))
+        with self._lock:
+            h = self.histograms.get(k)
+            if h is None:
+                h = self.histograms[k] = Histogram()
+            h.observe(value)
+
+    def histogram(self, name: str, **labels) -> Optional[Histogram]:
+        return self.histograms.get((name, self._labels(labels)))
+
+    def register_collector(self, fn: Callable[[], Dict[str, float]]) -> None:
+        """`fn` liefert Gauges {name: wert}, die bei jedem Export abgefragt werden."""
+        self.collectors.append(fn)
+
+    def _gauges(self) -> Dict[str, float]:
+        out = {}
+        for fn in self.collectors:
+            try:
+                out.update(fn())
+            except Exception:
+                pass
+        return out
+
+    # ----- Export -----
+    def prometheus(self) -> str:
+        def fmt(labels: Labels, extra: Labels = ()) -> str:
+            items = labels + extra
+            if not items:
+                return ""
+            return "{" + ",".join(f'{k}="{v.replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+                                  for k, v in items) + "}"
+        lines = []
+        with self._lock:
+            for name in sorted({n for n, _ in self.counters}):
+                lines.append(f"# TYPE {PREFIX}_{name} counter")
+                for (n, labels), v in sorted(self.counters.items()):
+                    if n == name:
+                        lines.append(f"{PREFIX}_{name}{fmt(labels)} {_num(v)}")
+            for name in sorted({n for n, _ in self.histograms}):
+                lines.append(f"# TYPE {PREFIX}_{name} histogram")
+                for (n, labels), h in sorted(self.histograms.items(), key=lambda kv: kv[0]):
+                    if n != name:
+                        continue
+                    cum = 0
+                    for b, c in zip(h.buckets, h.counts):
+                        cum += c
+                        lines.append(f"{PREFIX}_{name}_bucket{fmt(labels, (('le', f'{b:g}'),))} {cum}")
+                    lines.append(f"{PREFIX}_{name}_bucket{fmt(labels, (('le', '+Inf'),))} {h.count}")
+                    lines.append(f"{PREFIX}_{name}_sum{fmt(labels)} {_num(h.sum)}")
+                    lines.append(f"{PREFIX}_{name}_count{fmt(labels)} {h.count}")
+        for k, v in sorted(self._gauges().items()):
+            lines.append(f"# TYPE {PREFIX}_{k} gauge")
+            lines.append(f"{PREFIX}_{k} {_num(v)}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        def key(name: str, labels: Labels) -> str:
+            return name + ("{" + ",".join(f"{k}={v}" for k, v in labels) + "}" if labels else "")
+        with self._lock:
+            counters = {key(n, l): v for (n, l), v in sorted(self.counters.items())}
+            hists = {key(n, l): {"count": h.count, "sum": round(h.sum, 6),
+                                 "p50": h.quantile(0.50), "p95": h.quantile(0.95), "p99": h.quantile(0.99)}
+                     for (n, l), h in sorted(self.histograms.items(), key=lambda kv: kv[0])}
+        return {"counters": counters, "histograms": hists, "gauges": self._gauges()}
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+
+REGISTRY = Registry()
+inc = REGISTRY.inc
+observe = REGISTRY.observe
+prometheus = REGISTRY.prometheus
+snapshot = REGISTRY.snapshot
+
+
+@contextmanager
+def stage(name: str, **labels):
+    """Misst die Dauer eines Pipeline-Schritts als `stage_seconds{stage=...}`."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        REGISTRY.observe("stage_seconds", time.perf_counter() - t0, stage=name, **labels)
+
+
+def record_usage(model: str, usage) -> dict:
+    """Token-Usage einer Responses-API-Antwort verbuchen; liefert die gezählten Werte zurück."""
+    if usage is None:
+        return {}
+    def g(obj, name):
+        return (obj.get(name) if isinstance(obj, dict) else getattr(obj, name, None)) or 0
+    inp, out = int(g(usage, "input_tokens")), int(g(usage, "output_tokens"))
+    details = usage.get("input_tokens_details") if isinstance(usage, dict) else getattr(usage, "input_tokens_details", None)
+    cached = int(g(details, "cached_tokens")) if details else 0
+    REGISTRY.inc("tokens_total", inp, model=model, kind="input")
+    REGISTRY.inc("tokens_total", out, model=model, kind="output")
+    if cached:
+        REGISTRY.inc("tokens_total", cached, model=model, kind="cached_input")
+    p_in, p_cached, p_out = MODEL_PRICES.get(model, (0.0, 0.0, 0.0))
+    cost = ((inp - cached) * p_in + cached * p_cached + out * p_out) / 1_000_000
+    REGISTRY.inc("cost_usd_total", cost, model=model)
+    return {"input_tokens": inp, "output_tokens": out, "cached_tokens": cached, "cost_usd": cost}
+
+
+def register_routes() -> bool:
+    """Registriert `/openai_style_prompt/metrics` (Prometheus) und `/openai_style_prompt/metrics.json`
+    am ComfyUI-Server. Außerhalb von ComfyUI ein No-op."""
+    try:
+        from server import PromptServer
+        from aiohttp import web
+    except Exception:
+        return False
+    routes = PromptServer.instance.routes
+
+    @routes.get(f"/{PREFIX}/metrics")
+    async def _metrics(request):
+        return web.Response(text=prometheus(), headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    @routes.get(f"/{PREFIX}/metrics.json")
+    async def _metrics_json(request):
+        return web.json_response(snapshot())
+
+    return True
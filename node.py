@@ -1,15 +1,54 @@
 # ComfyUI/custom_nodes/openai_style_prompt/node.py
 # OpenAI Style Prompt (Subjectless) v1.6 — modular
-import os, pathlib
-from typing import Dict, Optional
+import asyncio, hashlib, os, re, threading, time
+from collections import OrderedDict
+from typing import Dict, List, Optional
 
 from .presets import PRESETS
-from .cache import DiskCache, lru_get, lru_put, cache_key
-from .utils import sanitize_subjects, format_prompt, image_to_b64, vision_hash, choose_model
-from .api import ensure_client, build_system_msg, build_user_parts, call_openai
+from .cache import (DiskCache, shared_disk_cache, LRU_MEM, lru_get, lru_put, lru_stats, singleflight_stats, cache_key,
+                    SINGLE_FLIGHT, NEAR_INDEX, BKTree)
+from .remote_cache import shared_remote_cache
+from .metrics import REGISTRY, stage
+from .breaker import BREAKER, CircuitOpenError, failure_class
+from .ratelimit import classify
+from .analysis import analyze, describe
+from .utils import sanitize_subjects, format_prompt, tensor_to_pil, frame_count, encode_image, pil_hash, hash_bits, tensor_fingerprint, choose_model, faster_model
+from .api import ensure_async_client, build_system_msg, build_user_parts, call_openai_async, call_openai_hedged_async, split_variants, run_sync, get_loop
 
 NODE_VERSION = "v1.6"
 
+# Rotation durch gecachte Varianten: Zähler pro Cache-Key, globaler Tick für IS_CHANGED
+_ROTATION: Dict[str, int] = {}
+_ROTATION_LOCK = threading.Lock()
+_ROTATION_TICK = 0
+
+# Template-Fallbacks (API down / Circuit offen): nur kurz im LRU, nie auf Disk/Remote unter dem echten Key
+FALLBACK_TTL_S = float(os.getenv("OPENAI_STYLE_PROMPT_FALLBACK_TTL_S", "60"))
+# IS_CHANGED-Fingerabdruck ohne Bild (verlinkte Inputs kommen dort als None an) -> Anzahl vorläufiger
+# Ausgaben (Fallback/Stale); begrenzt, älteste Einträge fallen heraus
+FALLBACK_MARKS_MAX = int(os.getenv("OPENAI_STYLE_PROMPT_FALLBACK_MARKS_MAX", "256"))
+_FALLBACK_MARKS: "OrderedDict[str, int]" = OrderedDict()
+_MARKS_LOCK = threading.Lock()
+
+
+def _set_mark(digest: str, provisional: bool) -> None:
+    """Vorläufige Ausgabe zählen (ComfyUI führt die Node beim nächsten Lauf erneut aus) bzw. Marke löschen."""
+    with _MARKS_LOCK:
+        if not provisional:
+            _FALLBACK_MARKS.pop(digest, None)
+            return
+        _FALLBACK_MARKS[digest] = _FALLBACK_MARKS.get(digest, 0) + 1
+        _FALLBACK_MARKS.move_to_end(digest)
+        while len(_FALLBACK_MARKS) > max(1, FALLBACK_MARKS_MAX):
+            _FALLBACK_MARKS.popitem(last=False)
+
+# Stale-while-revalidate: Hintergrund-Refresh abgelaufener Disk-Einträge, begrenzt und pro Key dedupliziert
+REFRESH_WORKERS = int(os.getenv("OPENAI_STYLE_PROMPT_REFRESH_WORKERS", "2"))
+REFRESH_QUEUE_MAX = int(os.getenv("OPENAI_STYLE_PROMPT_REFRESH_QUEUE", "64"))
+_REFRESHING: set = set()
+_REFRESH_LOCK = threading.Lock()
+_REFRESH_SEM: Optional[asyncio.Semaphore] = None  # wird auf dem geteilten Loop angelegt
+
 class OpenAIStylePrompt:
     """
     Subjectless Style/Environment Prompt Generator für ComfyUI (v1.6)
@@ -18,7 +57,7 @@ class OpenAIStylePrompt:
     - Presets + Style-Addon + Props (unbelebte Requisiten)
     - Kostenoptimierung: LRU+Disk Cache, Template-Mode, Tiered-Model-Policy
     - Formatter (schöne Kommas/Punkt) + konfigurierbarer Sanitizer
-    - Responses API mit robustem Retry & Modell-Fallback
+    - Responses API (async, geteilter Event-Loop) mit robustem Retry & Modell-Fallback
     """
 
     @classmethod
@@ -58,6 +97,22 @@ class OpenAIStylePrompt:
                 "image": ("IMAGE",),
                 "preset_override": ("STRING", {"default": ""}),
                 "model_override": ("STRING", {"default": ""}),
+                "image_max_side": ("INT", {"default": 1024, "min": 0, "max": 8192, "step": 64}),
+                "image_format": (["jpeg", "webp", "png"], {"default": "jpeg"}),
+                "image_quality": ("INT", {"default": 85, "min": 10, "max": 100}),
+                "image_detail": (["auto", "low", "high"], {"default": "auto"}),
+                "vision_hash_mode": (["ahash", "dhash"], {"default": "ahash"}),
+                "vision_match_distance": ("INT", {"default": 0, "min": 0, "max": 16}),
+                "latency_mode": (["off", "hedge"], {"default": "off"}),
+                "hedge_after_ms": ("INT", {"default": 0, "min": 0, "max": 120000, "step": 100}),
+                "deadline_ms": ("INT", {"default": 0, "min": 0, "max": 600000, "step": 500}),
+                "num_variants": ("INT", {"default": 1, "min": 1, "max": 8}),
+                "variant_index": ("INT", {"default": -1, "min": -1, "max": 7}),
+                "response_mode": (["full", "stream"], {"default": "full"}),
+                "stream_char_budget": ("INT", {"default": 0, "min": 0, "max": 4000, "step": 50}),
+                "stale_mode": (["off", "revalidate"], {"default": "off"}),
+                "cache_hard_expiry_days": ("INT", {"default": 0, "min": 0, "max": 3650}),
+                "local_vision_threshold": ("FLOAT", {"default": 0.75, "min": 0.0, "max": 1.0, "step": 0.05}),
             },
         }
 
@@ -66,16 +121,59 @@ class OpenAIStylePrompt:
     FUNCTION = "run"
     CATEGORY = "LLM/OpenAI"
 
-    def __init__(self):
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise RuntimeError("OPENAI_API_KEY Umgebungsvariable fehlt.")
-        self.client = ensure_client(api_key)
-        user_dir = pathlib.Path(os.getenv("COMFYUI_USER_PATH", "ComfyUI/user"))
-        self.cache = DiskCache(user_dir / "openai_style_prompt_cache")
+    @classmethod
+    def IS_CHANGED(cls, image=None, **kwargs):
+        """Fingerabdruck aus denselben Inputs wie der Cache-Key (plus Tensor-Stichprobe statt
+        PNG-Encode), damit ComfyUI unveränderte Nodes nicht erneut ausführt."""
+        digest = cls._fingerprint(image, kwargs)
+        p = {**cls._optional_defaults(), **kwargs}
+        if p.get("num_variants", 1) > 1 and p.get("variant_index", -1) < 0:
+            digest += f"|rotation={_ROTATION_TICK}"  # jede Ausführung rückt weiter -> nächste Variante
+        if _FALLBACK_MARKS:
+            # Marken ohne Bild: dieselben Werte sieht run() auch bei verlinktem Bild
+            mark = _FALLBACK_MARKS.get(cls._fingerprint(None, kwargs))
+            if mark:
+                digest += f"|fallback={mark}"  # Fallback-/Stale-Ausgabe nicht im ComfyUI-Cache festhalten
+        return digest
+
+    @classmethod
+    def _fingerprint(cls, image, kwargs: dict) -> str:
+        p = {**cls._optional_defaults(), **kwargs}
+        p.pop("debug_log", None)
+        raw = "|".join([NODE_VERSION, tensor_fingerprint(image)] + [f"{k}={p[k]}" for k in sorted(p)])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    # Client und Disk-Cache entstehen erst bei der ersten Nutzung (geteilt über alle Node-Instanzen);
+    # Cache-Treffer und Template-Mode brauchen weder API-Key noch OpenAI-SDK.
+    _client = None
+    _cache: Optional[DiskCache] = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            api_key = os.getenv("OPENAI_API_KEY")
+            if not api_key:
+                raise RuntimeError("OPENAI_API_KEY Umgebungsvariable fehlt.")
+            self._client = ensure_async_client(api_key)
+        return self._client
+
+    @client.setter
+    def client(self, value):
+        self._client = value
+
+    @property
+    def cache(self) -> DiskCache:
+        if self._cache is None:
+            self._cache = shared_disk_cache()
+        return self._cache
+
+    @cache.setter
+    def cache(self, value: DiskCache):
+        self._cache = value
 
     # -------- Template generator (kostenfrei) --------
-    def _template_generate(self, preset_name: str, base_text: str, style_addon: str, props: str, tone: str, language: str) -> Optional[str]:
+    def _template_generate(self, preset_name: str, base_text: str, style_addon: str, props: str, tone: str, language: str,
+                           analysis: Optional[dict] = None) -> Optional[str]:
         base = base_text or PRESETS.get(preset_name)
         if not base:
             return None
@@ -88,6 +186,8 @@ class OpenAIStylePrompt:
             "product": {"de":"sauberer, produktorientierter Look", "en":"clean, product-oriented look"},
         }
         tline = tone_map.get(tone, tone_map["neutral"]).get(language, "neutral")
+        # Vision ohne API: Licht-/Tonphrasen aus der lokalen Bildanalyse
+        tline = ", ".join([tline] + describe(analysis, language))
 
         props_txt = re_norm(props="")
         addon_txt = re_norm(props="")  # placeholder; below we'll use raw style_addon/props but cleaned minimally
@@ -117,78 +217,530 @@ class OpenAIStylePrompt:
     def run(self, model, preset, style_addon, props, language, prompt_tone, detail_level,
             max_tokens, temperature, template_mode, cost_mode, use_cache, cache_ttl_days,
             sanitizer_strength, strip_trailing_punctuation, debug_log,
-            image=None, preset_override="", model_override=""):
+            image=None, preset_override="", model_override="",
+            image_max_side=1024, image_format="jpeg", image_quality=85, image_detail="auto",
+            vision_hash_mode="ahash", vision_match_distance=0,
+            latency_mode="off", hedge_after_ms=0, deadline_ms=0, num_variants=1, variant_index=-1,
+            response_mode="full", stream_char_budget=0, stale_mode="off", cache_hard_expiry_days=0,
+            local_vision_threshold=0.75):
+        p = {k: v for k, v in locals().items() if k not in ("self", "image")}
+        with stage("request"):
+            # Vision: Tensor nur einmal konvertieren; PNG/base64 erst direkt vor dem API-Call
+            pil = self._convert(image, image_max_side)
+            req = self._prepare(p, pil)
+            out = self._lookup(req) or self._generate(req)
+            provisional = bool(req.get("fallback") or req.get("stale"))
+            if provisional or _FALLBACK_MARKS:
+                _set_mark(self._fingerprint(None, p), provisional)
+            return (self._pick(req, out),)
+
+    # -------- Pipeline-Bausteine (auch von Batch-/Listen-Nodes genutzt) --------
+    @staticmethod
+    def _optional_defaults() -> dict:
+        opt = OpenAIStylePrompt.INPUT_TYPES()["optional"]
+        return {k: spec[1]["default"] for k, spec in opt.items() if len(spec) > 1 and "default" in spec[1]}
+
+    @staticmethod
+    def _convert(image, max_side: int, index: int = 0):
+        if image is None:
+            return None
+        with stage("image_conversion"):
+            return tensor_to_pil(image, max_side, index=index)
 
-        # Inputs & policy
-        preset_text = (preset_override.strip() or PRESETS.get(preset, "")).strip()
-        image_b64 = image_to_b64(image) if image is not None else None
-        has_image = image_b64 is not None
-        chosen_model = choose_model(model, model_override, cost_mode, has_image, debug_log)
+    def _prepare(self, p: dict, pil) -> dict:
+        """Inputs & Policy für genau einen Request; liefert u.a. Modell und Cache-Key."""
+        req = dict(p)
+        req["preset_text"] = ((p.get("preset_override") or "").strip() or PRESETS.get(p["preset"], "")).strip()
+        req["pil"] = pil
+        req["has_image"] = pil is not None
+        req["chosen_model"] = choose_model(p["model"], p.get("model_override", ""), p["cost_mode"], req["has_image"], p["debug_log"])
 
         # Cache key
-        vhash = vision_hash(image)
-        key = cache_key(chosen_model, language, preset_text, style_addon, props, prompt_tone, detail_level, vhash, sanitizer_strength)
+        hash_mode = p.get("vision_hash_mode", "ahash")
+        if req["has_image"]:
+            with stage("hashing"):
+                req["vhash"] = pil_hash(pil, hash_mode)
+        else:
+            req["vhash"] = ""
+        upload = (f"img:{p.get('image_max_side', 1024)}:{p.get('image_format', 'jpeg')}:"
+                  f"{p.get('image_quality', 85)}:{p.get('image_detail', 'auto')}") if req["has_image"] else ""
+        req["num_variants"] = max(1, int(p.get("num_variants", 1) or 1))
+        if req["num_variants"] > 1:
+            upload += f"|variants:{req['num_variants']}"
+        if p.get("response_mode", "full") == "stream":
+            upload += f"|stream:{p.get('stream_char_budget', 0)}"  # erste Zeile/gekürzt statt Volltext
+        key_args = (req["chosen_model"], p["language"], req["preset_text"], p["style_addon"], p["props"],
+                    p["prompt_tone"], p["detail_level"])
+        req["key"] = cache_key(*key_args, req["vhash"], p["sanitizer_strength"], extra=upload)
+        # Near-Duplicate-Lookup: gleiche Nicht-Bild-Parameter, Bildhash nur ähnlich
+        req["near_base"] = cache_key(*key_args, f"near:{hash_mode}", p["sanitizer_strength"], extra=upload) if req["has_image"] else ""
 
         # TTL
-        ttl_sec = cache_ttl_days * 24 * 3600 if cache_ttl_days and cache_ttl_days > 0 else None
+        days = p["cache_ttl_days"]
+        req["ttl_sec"] = days * 24 * 3600 if days and days > 0 else None
+        # Stale-while-revalidate: bis zur harten Grenze (0 = unbegrenzt) wird ein abgelaufener Eintrag sofort geliefert
+        hard = p.get("cache_hard_expiry_days", 0)
+        req["swr"] = p.get("stale_mode", "off") == "revalidate" and req["ttl_sec"] is not None
+        req["hard_ttl_sec"] = max(hard * 24 * 3600, req["ttl_sec"]) if req["swr"] and hard and hard > 0 else None
+        return req
 
-        # Cache read
-        if use_cache:
+    def _lookup(self, req: dict, remote_hits: Optional[Dict[str, tuple]] = None) -> Optional[str]:
+        """LRU -> Disk -> Remote-Tier -> Near-Duplicate. `remote_hits`: bereits per Batch geholte Remote-Werte
+        ({key: (prompt, created)})."""
+        if not req["use_cache"]:
+            return None
+        key, debug_log = req["key"], req["debug_log"]
+        with stage("lru_lookup"):
             hit = lru_get(key)
-            if hit:
-                if debug_log: print(f"[OpenAIStylePrompt] LRU cache hit ({key[:8]}...)")
-                return (hit,)
-            disk_hit = self.cache.get(key, max_age_sec=ttl_sec)
-            if disk_hit:
-                if debug_log: print(f"[OpenAIStylePrompt] disk cache hit ({key[:8]}...)")
-                lru_put(key, disk_hit)
-                return (disk_hit,)
-            if debug_log: print(f"[OpenAIStylePrompt] cache miss ({key[:8]}...)")
-
-        # Template-mode (kostenfrei)
-        if template_mode in ("auto","on"):
-            if (template_mode == "on") or (image is None and not preset_override.strip() and detail_level <= 3):
-                templ = self._template_generate(preset, preset_text if preset_override.strip() else "", style_addon, props, prompt_tone, language)
+        if hit and LRU_MEM.is_transient(key):
+            # Template-Fallback nur bedienen, solange der Ausfall andauert; sonst regulär weitersuchen
+            if not BREAKER.is_open():
+                hit = None
+            else:
+                req["fallback"] = True
+                if debug_log: print(f"[OpenAIStylePrompt] circuit open, reusing template fallback ({key[:8]}...)")
+                REGISTRY.inc("requests_total", outcome="fallback_hit")
+                return hit
+        if hit:
+            if debug_log: print(f"[OpenAIStylePrompt] LRU cache hit ({key[:8]}...)")
+            REGISTRY.inc("requests_total", outcome="lru_hit")
+            self._index_near(req)
+            return hit
+        stale = None
+        with stage("disk_lookup"):
+            if req.get("swr"):
+                entry = self.cache.lookup(key, max_age_sec=req["hard_ttl_sec"])
+                disk_hit, age = entry if entry else (None, 0.0)
+                if disk_hit and age > req["ttl_sec"]:
+                    stale, disk_hit = disk_hit, None  # erst noch Remote nach einer frischen Version fragen
+            else:
+                disk_hit = self.cache.get(key, max_age_sec=req["ttl_sec"])
+        if disk_hit:
+            if debug_log: print(f"[OpenAIStylePrompt] disk cache hit ({key[:8]}...)")
+            REGISTRY.inc("requests_total", outcome="disk_hit")
+            lru_put(key, disk_hit)
+            self._index_near(req)
+            return disk_hit
+        remote = shared_remote_cache()
+        if remote is not None:
+            with stage("remote_lookup"):
+                remote_entry = remote_hits.get(key) if remote_hits is not None else remote.lookup(key, req["ttl_sec"])
+            remote_hit, created = remote_entry if remote_entry else (None, None)
+            if remote_hit:
+                if debug_log: print(f"[OpenAIStylePrompt] remote cache hit ({key[:8]}...)")
+                REGISTRY.inc("requests_total", outcome="remote_hit")
+                lru_put(key, remote_hit)
+                self.cache.put(key, remote_hit, created=created)  # Original-Zeitstempel: TTL läuft weiter
+                self._index_near(req)
+                return remote_hit
+        if stale:
+            if debug_log: print(f"[OpenAIStylePrompt] stale disk hit, refreshing in background ({key[:8]}...)")
+            REGISTRY.inc("requests_total", outcome="stale_hit")
+            req["stale"] = True
+            self._schedule_refresh(req)
+            self._index_near(req)
+            return stale
+        near_key, dist = NEAR_INDEX.find(req["near_base"], hash_bits(req["vhash"]), req.get("vision_match_distance", 0))
+        if near_key and near_key != key:
+            with stage("near_lookup"):
+                # transienter Template-Fallback des Nachbarn ist kein Treffer (würde sonst dauerhaft unter `key` landen)
+                near_hit = (None if LRU_MEM.is_transient(near_key) else lru_get(near_key)) \
+                    or self.cache.get(near_key, max_age_sec=req["ttl_sec"])
+            if near_hit:
+                if debug_log: print(f"[OpenAIStylePrompt] near-duplicate hit ({key[:8]}... ~ {near_key[:8]}..., distance {dist})")
+                REGISTRY.inc("requests_total", outcome="near_hit")
+                NEAR_INDEX.record_hit()
+                lru_put(key, near_hit)
+                return near_hit
+        if debug_log: print(f"[OpenAIStylePrompt] cache miss ({key[:8]}...)")
+        REGISTRY.inc("requests_total", outcome="miss")
+        return None
+
+    @staticmethod
+    def _pick(req: dict, value: str) -> str:
+        """Gecachtes Varianten-Set ("\n"-getrennt) -> eine Variante; fester Index oder Rotation pro Key."""
+        if req.get("num_variants", 1) <= 1 or not value or "\n" not in value:
+            return value
+        variants = value.split("\n")
+        idx = req.get("variant_index", -1)
+        if idx is None or idx < 0:
+            global _ROTATION_TICK
+            with _ROTATION_LOCK:
+                idx = _ROTATION.get(req["key"], 0)
+                _ROTATION[req["key"]] = idx + 1
+                _ROTATION_TICK += 1
+        choice = variants[idx % len(variants)]
+        if req.get("debug_log"): print(f"[OpenAIStylePrompt] variant {idx % len(variants) + 1}/{len(variants)}")
+        return choice
+
+    def _index_near(self, req: dict) -> None:
+        if req["near_base"]:
+            NEAR_INDEX.add(req["near_base"], hash_bits(req["vhash"]), req["key"])
+
+    def _store(self, req: dict, prompt: str) -> None:
+        if req["use_cache"] and prompt:
+            with stage("cache_write"):
+                lru_put(req["key"], prompt)
+                self.cache.put(req["key"], prompt)
+                self._index_near(req)
+                remote = shared_remote_cache()
+                if remote is not None:
+                    remote.put(req["key"], prompt)  # write-behind, blockiert nicht
+
+    def _schedule_refresh(self, req: dict) -> None:
+        """Abgelaufenen Key im Hintergrund neu erzeugen; höchstens ein Refresh pro Key, Warteschlange begrenzt."""
+        key = req["key"]
+        with _REFRESH_LOCK:
+            if key in _REFRESHING:
+                REGISTRY.inc("stale_refresh_total", result="deduped")
+                return
+            if len(_REFRESHING) >= REFRESH_QUEUE_MAX:
+                REGISTRY.inc("stale_refresh_total", result="dropped")
+                return
+            _REFRESHING.add(key)
+        asyncio.run_coroutine_threadsafe(self._refresh(dict(req, revalidate=True)), get_loop())
+
+    async def _refresh(self, req: dict) -> None:
+        global _REFRESH_SEM
+        if _REFRESH_SEM is None:
+            _REFRESH_SEM = asyncio.Semaphore(max(1, REFRESH_WORKERS))
+        result = "error"
+        try:
+            async with _REFRESH_SEM:
+                await self._generate_async(req)
+            result = "fallback" if req.get("fallback") else "ok"
+        except Exception as e:
+            if req["debug_log"]: print(f"[OpenAIStylePrompt] background refresh failed ({req['key'][:8]}...): {e}")
+        finally:
+            with _REFRESH_LOCK:
+                _REFRESHING.discard(req["key"])
+        REGISTRY.inc("stale_refresh_total", result=result)
+
+    def _generate(self, req: dict) -> str:
+        return run_sync(self._generate_async(req))
+
+    async def _generate_async(self, req: dict) -> str:
+        """Cache-Miss auflösen; identische Keys, die gleichzeitig in-flight sind, teilen sich einen Call."""
+        if not req["use_cache"]:
+            return await self._produce(req)
+        async def leader():
+            # ein eben fertig gewordener Leader hat den Key evtl. schon geschrieben (Fallbacks zählen nicht)
+            hit = None if LRU_MEM.is_transient(req["key"]) else lru_get(req["key"])
+            return hit or await self._produce(req)
+        return await SINGLE_FLIGHT.do(req["key"], leader)
+
+    async def _produce(self, req: dict) -> str:
+        """Template oder API-Call für einen Cache-Miss, inkl. Sanitizer und Cache-Write."""
+        preset, preset_text, key = req["preset"], req["preset_text"], req["key"]
+        style_addon, props, tone, language = req["style_addon"], req["props"], req["prompt_tone"], req["language"]
+        strength, strip_punct, debug_log = req["sanitizer_strength"], req["strip_trailing_punctuation"], req["debug_log"]
+        override = (req.get("preset_override") or "").strip()
+
+        # Template-mode (kostenfrei); Bilder nur mit eindeutiger lokaler Analyse, sonst Eskalation zur API
+        if req["template_mode"] in ("auto","on"):
+            local = (req["template_mode"] == "on") or (not req["has_image"] and not override and req["detail_level"] <= 3)
+            feats = await asyncio.to_thread(self._analysis, req)  # Konvertierung + Analyse nicht auf dem geteilten Loop
+            if not local and feats and not override and req["detail_level"] <= 3:
+                threshold = req.get("local_vision_threshold", 0.75)
+                local = threshold < 1.0 and feats["confidence"] >= threshold
+                REGISTRY.inc("local_vision_total", result="local" if local else "escalated")
+                if debug_log: print(f"[OpenAIStylePrompt] local vision confidence {feats['confidence']:.2f} "
+                                    f"(threshold {threshold:.2f}) -> {'template' if local else 'API'}")
+            if local:
+                if feats:
+                    # Die Phrasen hängen an Helligkeit, Palette, Temperatur, Sättigung – der aHash im Vision-Key
+                    # ignoriert z.B. die Gesamthelligkeit. Lokale Antworten daher nur unter Key + Analyse-Signatur.
+                    sig = "|".join(describe(feats, language))
+                    req["local_key"] = hashlib.sha256(f"{key}|local:{sig}".encode("utf-8")).hexdigest()
+                    hit = lru_get(req["local_key"]) if req["use_cache"] else None
+                    if hit:
+                        REGISTRY.inc("requests_total", outcome="local_hit")
+                        return hit
+                with stage("template"):
+                    templ = self._template_generate(preset, preset_text if override else "", style_addon, props, tone, language,
+                                                    analysis=feats)
                 if templ:
-                    final_templ = sanitize_subjects(templ, sanitizer_strength, strip_trailing_punctuation)
-                    if use_cache:
-                        lru_put(key, final_templ)
-                        self.cache.put(key, final_templ)
+                    with stage("sanitize"):
+                        final_templ = sanitize_subjects(templ, strength, strip_punct, language)
+                    if not feats:
+                        self._store(req, final_templ)
+                    elif req["use_cache"]:
+                        lru_put(req["local_key"], final_templ)  # nicht unter dem geteilten Vision-Key, nicht auf Disk
+                    REGISTRY.inc("generated_total", source="local_vision" if feats else "template")
                     if debug_log: print(f"[OpenAIStylePrompt] template-mode output ({key[:8]}...)")
-                    return (final_templ,)
+                    return final_templ
 
-        # OpenAI call (Responses API)
+        # OpenAI call (Responses API); fehlender API-Key/SDK soll sichtbar fehlschlagen, nicht als Template enden
+        client = self.client
+        if BREAKER.is_open():
+            return await self._fallback(req, "circuit open")
         system_msg = build_system_msg(language)
-        user_parts = build_user_parts(preset_text, style_addon, props, prompt_tone, detail_level, image_b64)
+        image_b64 = None
+        if req["has_image"]:
+            pil = await asyncio.to_thread(self._frame_pil, req)
+            image_format, image_detail = req.get("image_format", "jpeg"), req.get("image_detail", "auto")
+            t0 = time.perf_counter()
+            with stage("image_encode"):
+                image_b64, nbytes = await asyncio.to_thread(encode_image, pil, image_format, req.get("image_quality", 85))
+            REGISTRY.inc("image_upload_bytes_total", nbytes)
+            if debug_log:
+                print(f"[OpenAIStylePrompt] image upload: {image_format} {pil.size[0]}x{pil.size[1]}, "
+                      f"{nbytes/1024:.1f} KiB, encode {(time.perf_counter()-t0)*1000:.1f} ms, detail={image_detail}")
+        n = req.get("num_variants", 1)
+        user_parts = build_user_parts(preset_text, style_addon, props, tone, req["detail_level"], image_b64,
+                                      req.get("image_detail", "auto"), variants=n)
+        max_tokens = req["max_tokens"] * n
 
         try:
-            raw = call_openai(self.client, chosen_model, system_msg, user_parts, max_tokens, temperature, debug_log)
-            prompt1 = sanitize_subjects(raw, sanitizer_strength, strip_trailing_punctuation)
-            final_prompt = prompt1
+            model = req["chosen_model"]
+            deadline_s = (req.get("deadline_ms") or 0) / 1000.0 or None
+            stream_opts = None
+            if req.get("response_mode") == "stream":
+                stream_opts = {"stop_lines": n, "char_budget": (req.get("stream_char_budget") or 0) * n}
+            with stage("api_call", model=model):
+                if req.get("latency_mode") == "hedge":
+                    raw, winner = await call_openai_hedged_async(
+                        client, model, faster_model(model, req["has_image"]), system_msg, user_parts,
+                        max_tokens, req["temperature"], debug_log,
+                        hedge_after_s=(req.get("hedge_after_ms") or 0) / 1000.0, deadline_s=deadline_s, stream_opts=stream_opts)
+                    if debug_log and winner != model: print(f"[OpenAIStylePrompt] hedged answer from {winner}")
+                else:
+                    raw = await call_openai_async(client, model, system_msg, user_parts, max_tokens, req["temperature"], debug_log,
+                                                  deadline_s=deadline_s, stream_opts=stream_opts)
+            with stage("sanitize"):
+                if n > 1:
+                    final_prompt = self._sanitize_variants(raw, n, strength, strip_punct, language)
+                else:
+                    final_prompt = sanitize_subjects(raw, strength, strip_punct, language)
+            self._store(req, final_prompt)
+            REGISTRY.inc("generated_total", source="api")
+            return final_prompt
 
-            if use_cache and final_prompt:
-                lru_put(key, final_prompt)
-                self.cache.put(key, final_prompt)
+        except Exception as e:
+            # Template nur, wenn die API nicht verfügbar ist; Request-/Programmfehler sichtbar durchreichen
+            if not isinstance(e, CircuitOpenError) and failure_class(e) is None and classify(e) == "fatal":
+                raise
+            return await self._fallback(req, str(e) or type(e).__name__)
 
-            return (final_prompt,)
+    @staticmethod
+    def _frame_pil(req: dict):
+        """PIL des Requests; Batch-Frames werden erst im Worker (erneut) konvertiert."""
+        if req.get("pil") is None and req.get("frame") is not None:
+            image, index, max_side = req["frame"]
+            req["pil"] = OpenAIStylePrompt._convert(image, max_side, index=index)
+        return req.get("pil")
 
-        except Exception as e:
-            if debug_log: print(f"[OpenAIStylePrompt] API failed, fallback to template ({e})")
-            templ = self._template_generate(preset, preset_text, style_addon, props, prompt_tone, language)
-            if templ:
-                final_templ = sanitize_subjects(templ, sanitizer_strength, strip_trailing_punctuation)
-                if use_cache:
-                    lru_put(key, final_templ)
-                    self.cache.put(key, final_templ)
-                return (final_templ,)
-            fallback = preset_text
-            fallback = sanitize_subjects(fallback, sanitizer_strength, strip_trailing_punctuation)
-            if use_cache:
-                lru_put(key, fallback)
-                self.cache.put(key, fallback)
-            return (fallback,)
+    @staticmethod
+    def _analysis(req: dict) -> Optional[dict]:
+        """Lokale Bildmerkmale des Frames (einmal pro Request berechnet)."""
+        if "analysis" not in req:
+            req["analysis"] = None
+            pil = OpenAIStylePrompt._frame_pil(req)
+            if pil is not None:
+                with stage("local_analysis"):
+                    req["analysis"] = analyze(pil)
+        return req["analysis"]
+
+    async def _fallback(self, req: dict, reason: str) -> str:
+        """Template statt API. Nur mit kurzer TTL im LRU – der echte Key wird beim nächsten
+        erfolgreichen Call regulär befüllt, Disk/Remote sehen den Fallback nie."""
+        if req["debug_log"]: print(f"[OpenAIStylePrompt] API unavailable, fallback to template ({reason})")
+        REGISTRY.inc("generated_total", source="fallback")
+        strength, strip_punct, language = req["sanitizer_strength"], req["strip_trailing_punctuation"], req["language"]
+        templ = self._template_generate(req["preset"], req["preset_text"], req["style_addon"], req["props"],
+                                        req["prompt_tone"], language, analysis=await asyncio.to_thread(self._analysis, req))
+        out = sanitize_subjects(templ or req["preset_text"], strength, strip_punct, language)
+        req["fallback"] = True
+        if req["use_cache"] and out and not req.get("revalidate"):  # Refresh: der Stale-Eintrag ist besser als ein Template
+            lru_put(req["key"], out, ttl=FALLBACK_TTL_S)
+        return out
+
+    @staticmethod
+    def _sanitize_variants(raw: str, n: int, strength: str, strip_punct: bool, language: str) -> str:
+        """Jeden Kandidaten sanitisieren, per format_prompt-Normalisierung deduplizieren -> "\n"-Set."""
+        seen, out = set(), []
+        for cand in split_variants(raw):
+            final = sanitize_subjects(cand, strength, strip_punct, language)
+            norm = format_prompt(final).lower()
+            if final and norm not in seen:
+                seen.add(norm)
+                out.append(final)
+        return "\n".join(out[:n]) or sanitize_subjects(raw, strength, strip_punct, language)
+
+    def _fan_out(self, reqs: List[dict], max_workers: int, node_inputs: Optional[dict] = None) -> List[str]:
+        """Erst alle Cache-Hits, dann die Misses (dedupliziert per Cache-Key bzw. per
+        Near-Duplicate-Bildhash) mit höchstens `max_workers` gleichzeitigen Requests.
+        Die Ergebnisreihenfolge entspricht `reqs`. `node_inputs` (Node-Inputs ohne Bild, wie sie
+        IS_CHANGED sieht): ist eine Ausgabe vorläufig, wird die ganze Liste beim nächsten Lauf neu erzeugt."""
+        results: List[Optional[str]] = [None] * len(reqs)
+        pending: Dict[str, List[int]] = {}
+        near: Dict[str, BKTree] = {}
+        remote_hits = None
+        remote = shared_remote_cache()
+        if remote is not None:
+            # ein Roundtrip für alle Keys, die nicht schon im LRU liegen
+            keys = [r["key"] for r in reqs if r["use_cache"] and r["key"] not in LRU_MEM]
+            with stage("remote_lookup"):
+                remote_hits = remote.lookup_many(keys, reqs[0]["ttl_sec"]) if keys else {}
+        for i, req in enumerate(reqs):
+            hit = self._lookup(req, remote_hits) if req["key"] not in pending else None
+            if hit:
+                results[i] = hit
+                req["pil"] = None
+                continue
+            leader = req["key"] if req["key"] in pending else None
+            dist = req.get("vision_match_distance", 0)
+            if leader is None and req["near_base"] and dist > 0:
+                leader = near.setdefault(req["near_base"], BKTree()).nearest(hash_bits(req["vhash"]), dist)[0]
+            if leader is not None:
+                pending[leader].append(i)
+                req["pil"] = None
+            else:
+                pending[req["key"]] = [i]
+                if req["near_base"]:
+                    near.setdefault(req["near_base"], BKTree()).add(hash_bits(req["vhash"]), req["key"])
+        if pending:
+            outs = run_sync(self._gather_bounded([reqs[idx[0]] for idx in pending.values()], max_workers))
+            redo = []
+            for idx, out in zip(pending.values(), outs):
+                if reqs[idx[0]].get("local_key"):
+                    # lokale Antwort gilt nur für die Analyse des Leader-Frames: Follower selbst analysieren
+                    results[idx[0]] = out
+                    redo += idx[1:]
+                    continue
+                for i in idx:
+                    results[i] = out
+                    if i != idx[0] and reqs[i]["use_cache"] and out:
+                        lru_put(reqs[i]["key"], out, ttl=FALLBACK_TTL_S if reqs[idx[0]].get("fallback") else None)
+            if redo:
+                # ohne Single-Flight: gleicher Key, aber evtl. andere Helligkeit/Palette
+                outs = run_sync(self._gather_bounded([reqs[i] for i in redo], max_workers, coalesce=False))
+                for i, out in zip(redo, outs):
+                    results[i] = out
+        if node_inputs is not None:
+            provisional = any(r.get("fallback") or r.get("stale") for r in reqs)
+            if provisional or _FALLBACK_MARKS:
+                _set_mark(self._fingerprint(None, node_inputs), provisional)
+        return [self._pick(req, out) for req, out in zip(reqs, results)]
+
+    async def _gather_bounded(self, reqs: List[dict], limit: int, coalesce: bool = True) -> List[str]:
+        sem = asyncio.Semaphore(max(1, int(limit)))
+        async def one(req):
+            async with sem:
+                try:
+                    return await (self._generate_async(req) if coalesce else self._produce(req))
+                finally:
+                    req["pil"] = None  # nur die laufenden Worker halten Bilder
+        return await asyncio.gather(*(one(r) for r in reqs))
+
+
+class OpenAIStylePromptBatch(OpenAIStylePrompt):
+    """
+    Batch-Variante: ein Prompt pro Frame eines IMAGE-Batches (Listen-Output).
+    Frames mit gleichem vision_hash werden nur einmal angefragt; Misses laufen
+    parallel über einen begrenzten Worker-Pool, die Reihenfolge bleibt erhalten.
+    """
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        types = super().INPUT_TYPES()
+        types["required"]["image"] = types["optional"].pop("image")
+        types["required"]["max_workers"] = ("INT", {"default": 4, "min": 1, "max": 32})
+        return types
+
+    RETURN_TYPES = ("STRING",)
+    RETURN_NAMES = ("image_prompts",)
+    OUTPUT_IS_LIST = (True,)
+    FUNCTION = "run_batch"
+
+    def run_batch(self, image, max_workers=4, **kwargs):
+        p = {**self._optional_defaults(), **kwargs}
+        reqs = []
+        for i in range(frame_count(image)):
+            # Frame nur zum Hashen konvertieren und sofort wieder freigeben; Misses konvertiert der Worker erneut
+            req = self._prepare(p, self._convert(image, p["image_max_side"], index=i))
+            req["pil"], req["frame"] = None, (image, i, p["image_max_side"])
+            reqs.append(req)
+        if p["debug_log"]:
+            print(f"[OpenAIStylePrompt] batch: {len(reqs)} frames, {len({r['key'] for r in reqs})} unique keys")
+        return (self._fan_out(reqs, max_workers, dict(kwargs, max_workers=max_workers)),)
+
+class OpenAIStylePromptMulti(OpenAIStylePrompt):
+    """
+    Listen-Variante: alle Kombinationen aus Presets × Style-Addons × Tones × Sprachen.
+    Cache-Hits werden zuerst aufgelöst, die Misses laufen mit höchstens
+    `max_in_flight` gleichzeitigen Requests. Reihenfolge: Preset, Addon, Tone, Sprache.
+    """
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        types = super().INPUT_TYPES()
+        req = types["required"]
+        for k in ("preset", "style_addon", "prompt_tone", "language"):
+            req.pop(k)
+        types["required"] = {
+            "presets": ("STRING", {"multiline": True, "default": "Greenscreen Studio"}),
+            "style_addons": ("STRING", {"multiline": True, "default": ""}),
+            "prompt_tones": ("STRING", {"default": "photography"}),
+            "languages": ("STRING", {"default": "de"}),
+            "max_in_flight": ("INT", {"default": 8, "min": 1, "max": 64}),
+            **req,
+        }
+        return types
+
+    RETURN_TYPES = ("STRING",)
+    RETURN_NAMES = ("image_prompts",)
+    OUTPUT_IS_LIST = (True,)
+    FUNCTION = "run_multi"
+
+    @staticmethod
+    def _lines(s: str) -> List[str]:
+        return [l.strip() for l in (s or "").splitlines() if l.strip()]
+
+    @staticmethod
+    def _items(s: str) -> List[str]:
+        return [t.strip() for t in re.split(r"[,\n]", s or "") if t.strip()]
+
+    @staticmethod
+    def _match_preset(name: str) -> Optional[str]:
+        def canon(x: str) -> str:
+            return re.sub(r"\s*[-–—]\s*", "-", x.strip().lower())
+        if name in PRESETS:
+            return name
+        wanted = canon(name)
+        return next((k for k in PRESETS if canon(k) == wanted), None)
+
+    def run_multi(self, presets, style_addons, prompt_tones, languages, max_in_flight=8, image=None, **kwargs):
+        p = {**self._optional_defaults(), **kwargs}
+        pil = self._convert(image, p["image_max_side"])
+
+        reqs = []
+        for name in self._lines(presets) or ["Greenscreen Studio"]:
+            # unbekannte Zeilen werden als freier Preset-Text behandelt
+            preset = self._match_preset(name)
+            override = p["preset_override"] if preset else name
+            for addon in self._lines(style_addons) or [""]:
+                for tone in self._items(prompt_tones) or ["photography"]:
+                    for language in self._items(languages) or ["de"]:
+                        reqs.append(self._prepare(dict(p, preset=preset or name, preset_override=override,
+                                                       style_addon=addon, prompt_tone=tone, language=language), pil))
+        if p["debug_log"]:
+            print(f"[OpenAIStylePrompt] multi: {len(reqs)} combinations, max_in_flight={max_in_flight}")
+        return (self._fan_out(reqs, max_in_flight, dict(kwargs, presets=presets, style_addons=style_addons,
+                                                        prompt_tones=prompt_tones, languages=languages,
+                                                        max_in_flight=max_in_flight)),)
+
+def _cache_gauges() -> Dict[str, float]:
+    g = {f"lru_{k}": v for k, v in lru_stats().items()}
+    g.update({f"singleflight_{k}": v for k, v in singleflight_stats().items()})
+    g["near_duplicate_hits"] = NEAR_INDEX.near_hits
+    remote = shared_remote_cache()
+    if remote is not None:
+        g.update({f"remote_cache_{k}": v for k, v in remote.stats().items()})
+    return g
+
+REGISTRY.register_collector(_cache_gauges)
 
 # small local helper (kept here to avoid extra import just for two lines)
-import re
 def re_norm(props: str) -> str:
     return re.sub(r"\s+", " ", (props or "").strip().lower())
@@ -0,0 +1,186 @@
+# ComfyUI/custom_nodes/openai_style_prompt/ratelimit.py
+# Rate-Limit-Scheduler: Token-Buckets pro Modell (RPM/TPM), gelernt aus x-ratelimit-*-Headern
+import asyncio, math, os, random, re, sys
+from typing import Dict, Optional
+
+from . import metrics
+
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_UNIT = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_duration(s) -> Optional[float]:
+    """'1s', '6m0s', '20ms', '0.5' -> Sekunden."""
+    if s is None:
+        return None
+    s = str(s).strip()
+    try:
+        return float(s)
+    except ValueError:
+        pass
+    parts = _DURATION.findall(s)
+    return sum(float(v) * _UNIT[u] for v, u in parts) if parts else None
+
+
+def backoff(attempt: int, base: float = 0.5, cap: float = 20.0) -> float:
+    """Exponentieller Backoff mit Full Jitter."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def estimate_tokens(system_msg: str, user_parts: list, max_tokens: int) -> int:
+    chars = len(system_msg or "")
+    images = 0
+    for p in user_parts or []:
+        if p.get("type") == "input_text":
+            chars += len(p.get("text", ""))
+        elif p.get("type") == "input_image":
+            images += 85 if p.get("detail") == "low" else 765
+    return chars // 4 + images + int(max_tokens or 0)
+
+
+def classify(exc: BaseException) -> str:
+    """-> 'model_unavailable' | 'rate_limit' | 'quota' | 'retryable' | 'fatal'
+    Retrybar sind nur 408/409/5xx, Timeouts und Verbindungsfehler; alles andere ist 'fatal'."""
+    msg = str(exc).lower()
+    if (("model" in msg and "not" in msg and "available" in msg)
+            or ("access" in msg and "denied" in msg)
+            or ("model" in msg and ("does not exist" in msg or "not found" in msg))):
+        return "model_unavailable"
+    status = getattr(exc, "status_code", None)
+    if status == 429:
+        return "quota" if "insufficient_quota" in msg or "quota" in msg else "rate_limit"
+    if isinstance(status, int):
+        return "retryable" if status in (408, 409) or status >= 500 else "fatal"
+    if is_transport_error(exc):
+        return "retryable"
+    return "fatal"  # lokale Fehler (TypeError, KeyError, ...) nicht wiederholen – jeder Retry kostet einen Request
+
+
+def is_transport_error(exc: BaseException) -> bool:
+    """Timeouts und Verbindungsfehler (openai.APIConnectionError inkl. APITimeoutError)."""
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError)):
+        return True
+    openai = sys.modules.get("openai")  # nur wenn das SDK schon geladen ist – dann stammt der Fehler evtl. daher
+    return openai is not None and isinstance(exc, (openai.APIConnectionError, openai.APITimeoutError))
+
+
+class TokenBucket:
+    def __init__(self, capacity: float = math.inf, per_sec: float = math.inf):
+        self.capacity = capacity
+        self.per_sec = per_sec
+        self.tokens = capacity
+        self.stamp = 0.0
+
+    def _refill(self, now: float) -> None:
+        if self.stamp and self.per_sec != math.inf:
+            self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.per_sec)
+        elif self.per_sec == math.inf:
+            self.tokens = self.capacity
+        self.stamp = now
+
+    def wait_time(self, n: float, now: float) -> float:
+        self._refill(now)
+        n = min(n, self.capacity)
+        if self.tokens >= n:
+            return 0.0
+        return (n - self.tokens) / self.per_sec if self.per_sec > 0 else math.inf
+
+    def take(self, n: float) -> None:
+        self.tokens -= min(n, self.capacity)
+
+    def configure(self, limit: float, remaining: Optional[float], now: float) -> None:
+        self._refill(now)
+        self.capacity = limit
+        self.per_sec = limit / 60.0
+        self.tokens = min(self.tokens, limit) if remaining is None else min(self.tokens, remaining, limit)
+
+
+class ModelLimiter:
+    """RPM- und TPM-Bucket eines Modells. Läuft ausschließlich auf dem geteilten Event-Loop."""
+    def __init__(self, model: str, rpm: Optional[float] = None, tpm: Optional[float] = None):
+        self.model = model
+        self.requests = TokenBucket()
+        self.tokens = TokenBucket()
+        self.paused_until = 0.0
+        self.rpm_cap, self.tpm_cap = rpm, tpm
+        now = asyncio.get_running_loop().time()
+        if rpm:
+            self.requests.configure(rpm, None, now)
+        if tpm:
+            self.tokens.configure(tpm, None, now)
+
+    async def acquire(self, est_tokens: int, deadline: Optional[float] = None) -> float:
+        """Wartet, bis Request- und Token-Budget reichen; TimeoutError, wenn `deadline` (loop.time) nicht reicht."""
+        loop = asyncio.get_running_loop()
+        waited = 0.0
+        while True:
+            now = loop.time()
+            wait = max(self.paused_until - now, self.requests.wait_time(1, now), self.tokens.wait_time(est_tokens, now))
+            if wait <= 0:
+                self.requests.take(1)
+                self.tokens.take(est_tokens)
+                if waited:
+                    metrics.inc("ratelimit_waits_total", model=self.model)
+                    metrics.observe("ratelimit_wait_seconds", waited, model=self.model)
+                return waited
+            if deadline is not None and now + wait > deadline:
+                raise TimeoutError(f"rate limit for {self.model}: would wait {wait:.1f}s beyond the request deadline")
+            await asyncio.sleep(wait)
+            waited += wait
+
+    def settle(self, estimated: int, actual: int) -> None:
+        """Schätzung gegen die tatsächliche Usage verrechnen."""
+        self.tokens.tokens = min(self.tokens.capacity, self.tokens.tokens + (estimated - actual))
+
+    def pause(self, seconds: float) -> None:
+        loop = asyncio.get_running_loop()
+        self.paused_until = max(self.paused_until, loop.time() + seconds)
+
+    def update(self, headers) -> None:
+        if not headers:
+            return
+        get = headers.get
+        now = asyncio.get_running_loop().time()
+        for bucket, kind, cap in ((self.requests, "requests", self.rpm_cap), (self.tokens, "tokens", self.tpm_cap)):
+            try:
+                limit = float(get(f"x-ratelimit-limit-{kind}"))
+            except (TypeError, ValueError):
+                continue
+            try:
+                remaining = float(get(f"x-ratelimit-remaining-{kind}"))
+            except (TypeError, ValueError):
+                remaining = None
+            bucket.configure(min(limit, cap) if cap else limit, remaining, now)
+            if remaining is not None and remaining <= 0:
+                reset = parse_duration(get(f"x-ratelimit-reset-{kind}"))
+                if reset:
+                    self.paused_until = max(self.paused_until, now + reset)
+
+
+class Scheduler:
+    def __init__(self):
+        self._limiters: Dict[str, ModelLimiter] = {}
+        self.rpm = float(os.getenv("OPENAI_STYLE_PROMPT_RPM", "0")) or None
+        self.tpm = float(os.getenv("OPENAI_STYLE_PROMPT_TPM", "0")) or None
+
+    def limiter(self, model: str) -> ModelLimiter:
+        lim = self._limiters.get(model)
+        if lim is None:
+            lim = self._limiters[model] = ModelLimiter(model, self.rpm, self.tpm)
+        return lim
+
+
+SCHEDULER = Scheduler()
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    ms = headers.get("retry-after-ms")
+    if ms:
+        try:
+            return float(ms) / 1000.0
+        except ValueError:
+            pass
+    return parse_duration(headers.get("retry-after"))
@@ -0,0 +1,370 @@
+# ComfyUI/custom_nodes/openai_style_prompt/remote_cache.py
+# Geteilter Cache-Tier für mehrere ComfyUI-Worker/Hosts (hinter LRU -> Disk):
+#   OPENAI_STYLE_PROMPT_REMOTE_CACHE=redis://[:passwort@]host:6379/0   (Redis-kompatibel, RESP)
+#   OPENAI_STYLE_PROMPT_REMOTE_CACHE=http://host:8790                  (kleiner HTTP-Service, s.u.)
+# Referenzserver zum Testen:  python remote_cache.py serve --port 8790
+# Lesen: read-through mit kurzem Timeout; Schreiben: write-behind über einen Hintergrund-Thread.
+# Nach einem Fehler wird der Tier kurz übersprungen, damit ein langsamer Cache nie den Request bremst.
+import http.client, json, os, queue, socket, threading, time
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import unquote, urlparse
+
+DEFAULT_TIMEOUT_MS = 150
+DEFAULT_TTL_DAYS = 30
+
+
+class RemoteCacheError(Exception):
+    pass
+
+
+# ----- Backends -----
+class RedisBackend:
+    """Minimaler RESP-Client (MGET, SET … EX) – eine Verbindung pro Thread."""
+    PREFIX = "osp:"
+
+    def __init__(self, url: str, timeout: float):
+        u = urlparse(url)
+        self.host, self.port = u.hostname or "127.0.0.1", u.port or 6379
+        self.password = unquote(u.password) if u.password else None
+        self.db = int((u.path or "/0").strip("/") or 0)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    @staticmethod
+    def _encode(*args) -> bytes:
+        out = [b"*%d\r\n" % len(args)]
+        for a in args:
+            b = a if isinstance(a, bytes) else str(a).encode("utf-8")
+            out.append(b"$%d\r\n%s\r\n" % (len(b), b))
+        return b"".join(out)
+
+    def _read(self, f):
+        line = f.readline()
+        if not line:
+            raise RemoteCacheError("connection closed")
+        t, body = line[:1], line[1:-2]
+        if t == b"+":
+            return body.decode()
+        if t == b"-":
+            raise RemoteCacheError(body.decode(errors="replace"))
+        if t == b":":
+            return int(body)
+        if t == b"$":
+            n = int(body)
+            return None if n < 0 else f.read(n + 2)[:-2].decode("utf-8")
+        if t == b"*":
+            n = int(body)
+            return None if n < 0 else [self._read(f) for _ in range(n)]
+        raise RemoteCacheError(f"unexpected reply {line[:20]!r}")
+
+    def _conn(self):
+        c = getattr(self._local, "conn", None)
+        if c is None:
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            c = self._local.conn = (sock, sock.makefile("rb"))
+            init = ([("AUTH", self.password)] if self.password else []) + ([("SELECT", self.db)] if self.db else [])
+            if init:
+                self._pipeline(init)
+        return c
+
+    def _pipeline(self, commands: List[tuple]) -> list:
+        sock, f = self._conn()
+        try:
+            sock.sendall(b"".join(self._encode(*c) for c in commands))
+            return [self._read(f) for _ in commands]
+        except (OSError, RemoteCacheError):
+            self.close()
+            raise
+
+    def close(self) -> None:
+        c = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if c:
+            try:
+                c[0].close()
+            except OSError:
+                pass
+
+    def mget(self, keys: List[str]) -> Dict[str, str]:
+        vals = self._pipeline([("MGET", *[self.PREFIX + k for k in keys])])[0] or []
+        return {k: v for k, v in zip(keys, vals) if v is not None}
+
+    def mset(self, items: Dict[str, str], ttl_sec: int) -> None:
+        cmds = [("SET", self.PREFIX + k, v, "EX", ttl_sec) if ttl_sec else ("SET", self.PREFIX + k, v)
+                for k, v in items.items()]
+        self._pipeline(cmds)
+
+
+class HttpBackend:
+    """JSON über HTTP/1.1 keep-alive: POST /mget {"keys": [...]}, POST /mset {"items": {...}, "ttl": s}."""
+
+    def __init__(self, url: str, timeout: float):
+        u = urlparse(url)
+        self.host, self.port = u.hostname or "127.0.0.1", u.port or 80
+        self.base = (u.path or "").rstrip("/")
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _post(self, path: str, body: dict) -> dict:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        data = json.dumps(body).encode("utf-8")
+        try:
+            conn.request("POST", self.base + path, data, {"Content-Type": "application/json"})
+            resp = conn.getresponse()
+            payload = resp.read()
+        except (OSError, http.client.HTTPException):
+            self.close()
+            raise
+        if resp.status != 200:
+            raise RemoteCacheError(f"HTTP {resp.status}")
+        return json.loads(payload or b"{}")
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn:
+            conn.close()
+
+    def mget(self, keys: List[str]) -> Dict[str, str]:
+        return self._post("/mget", {"keys": keys}).get("values") or {}
+
+    def mset(self, items: Dict[str, str], ttl_sec: int) -> None:
+        self._post("/mset", {"items": items, "ttl": ttl_sec})
+
+
+# ----- Tier -----
+class RemoteCache:
+    """
+    Read-through (`get`/`get_many`, ein Roundtrip pro Batch) und write-behind (`put` landet in einer
+    Queue, ein Daemon-Thread schreibt gebündelt). Fehler/Timeouts schalten den Tier für
+    `backoff_sec` ab; volle Queue -> Einträge werden verworfen statt zu blockieren.
+    """
+    BATCH = 64
+
+    def __init__(self, backend, ttl_sec: int = DEFAULT_TTL_DAYS * 86400, backoff_sec: float = 5.0,
+                 queue_size: int = 4096):
+        self.backend = backend
+        self.ttl_sec = ttl_sec
+        self.backoff_sec = backoff_sec
+        self._down_until = 0.0
+        self._queue: "queue.Queue[Tuple[str, str]]" = queue.Queue(maxsize=queue_size)
+        self._writer: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.errors = self.skipped = self.written = self.dropped = 0
+
+    def available(self) -> bool:
+        return time.monotonic() >= self._down_until
+
+    def _failed(self) -> None:
+        self.errors += 1
+        self._down_until = time.monotonic() + self.backoff_sec
+
+    @staticmethod
+    def _decode(raw: str, max_age_sec: Optional[int]) -> Optional[Tuple[str, float]]:
+        try:
+            entry = json.loads(raw)
+            prompt, created = entry["prompt"], float(entry["created"])
+        except (ValueError, KeyError, TypeError):
+            return None
+        if not prompt or (max_age_sec is not None and time.time() - created > max_age_sec):
+            return None
+        return prompt, created
+
+    def lookup_many(self, keys: Iterable[str], max_age_sec: Optional[int] = None) -> Dict[str, Tuple[str, float]]:
+        """Wie `get_many`, aber -> {key: (prompt, created)}: lokale Kopien behalten den Original-Zeitstempel."""
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return {}
+        if not self.available():
+            self.skipped += len(keys)
+            return {}
+        try:
+            raw = self.backend.mget(keys)
+        except Exception:
+            self._failed()
+            return {}
+        out = {}
+        for k in keys:
+            v = self._decode(raw[k], max_age_sec) if k in raw else None
+            if v:
+                out[k] = v
+        self.hits += len(out)
+        self.misses += len(keys) - len(out)
+        return out
+
+    def lookup(self, key: str, max_age_sec: Optional[int] = None) -> Optional[Tuple[str, float]]:
+        return self.lookup_many([key], max_age_sec).get(key)
+
+    def get_many(self, keys: Iterable[str], max_age_sec: Optional[int] = None) -> Dict[str, str]:
+        return {k: v[0] for k, v in self.lookup_many(keys, max_age_sec).items()}
+
+    def get(self, key: str, max_age_sec: Optional[int] = None) -> Optional[str]:
+        return self.get_many([key], max_age_sec).get(key)
+
+    def put(self, key: str, prompt: str) -> None:
+        entry = json.dumps({"prompt": prompt, "created": time.time()})
+        try:
+            self._queue.put_nowait((key, entry))
+        except queue.Full:
+            self.dropped += 1
+            return
+        self._ensure_writer()
+
+    def put_many(self, items: Dict[str, str]) -> None:
+        for k, v in items.items():
+            self.put(k, v)
+
+    def _ensure_writer(self) -> None:
+        if self._writer is not None:
+            return
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="OpenAIStylePrompt-remote-cache", daemon=True)
+                self._writer.start()
+
+    def _write_loop(self) -> None:
+        while True:
+            batch = dict([self._queue.get()])
+            deadline = time.monotonic() + 0.05  # kurz sammeln -> ein Roundtrip für viele Writes
+            while len(batch) < self.BATCH:
+                try:
+                    k, v = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                batch[k] = v
+            while not self.available():
+                time.sleep(min(self.backoff_sec, max(0.01, self._down_until - time.monotonic())))
+            try:
+                self.backend.mset(batch, self.ttl_sec)
+                self.written += len(batch)
+            except Exception:
+                self._failed()
+                self.dropped += len(batch)
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Wartet, bis die Write-Queue leer ist (Tests, Warm-up-CLI)."""
+        end = time.monotonic() + timeout
+        while not self._queue.empty() and time.monotonic() < end:
+            time.sleep(0.01)
+        time.sleep(0.06)
+        return self._queue.empty()
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "errors": self.errors, "skipped": self.skipped,
+                "written": self.written, "dropped": self.dropped, "queued": self._queue.qsize(),
+                "available": int(self.available())}
+
+
+def from_url(url: str, timeout_ms: Optional[float] = None, ttl_days: Optional[float] = None) -> RemoteCache:
+    timeout = (timeout_ms if timeout_ms is not None else DEFAULT_TIMEOUT_MS) / 1000.0
+    scheme = urlparse(url).scheme
+    if scheme in ("redis", "rediss"):
+        if scheme == "rediss":
+            raise ValueError("rediss:// (TLS) wird nicht unterstützt")
+        backend = RedisBackend(url, timeout)
+    elif scheme in ("http", "https"):
+        if scheme == "https":
+            raise ValueError("https:// wird nicht unterstützt – Cache-Service im internen Netz per http betreiben")
+        backend = HttpBackend(url, timeout)
+    else:
+        raise ValueError(f"unbekanntes Remote-Cache-Schema: {url}")
+    return RemoteCache(backend, ttl_sec=int((ttl_days if ttl_days is not None else DEFAULT_TTL_DAYS) * 86400))
+
+
+_SHARED: Optional[RemoteCache] = None
+_SHARED_URL: Optional[str] = None
+_SHARED_LOCK = threading.Lock()
+
+
+def shared_remote_cache() -> Optional[RemoteCache]:
+    """Tier aus OPENAI_STYLE_PROMPT_REMOTE_CACHE (None = aus); eine Instanz pro Prozess."""
+    global _SHARED, _SHARED_URL
+    url = os.getenv("OPENAI_STYLE_PROMPT_REMOTE_CACHE", "").strip()
+    if not url:
+        return None
+    with _SHARED_LOCK:
+        if _SHARED is None or _SHARED_URL != url:
+            _SHARED = from_url(url, float(os.getenv("OPENAI_STYLE_PROMPT_REMOTE_CACHE_TIMEOUT_MS", DEFAULT_TIMEOUT_MS)),
+                               float(os.getenv("OPENAI_STYLE_PROMPT_REMOTE_CACHE_TTL_DAYS", DEFAULT_TTL_DAYS)))
+            _SHARED_URL = url
+    return _SHARED
+
+
+# ----- Referenzserver (HTTP) -----
+def make_server(host: str = "127.0.0.1", port: int = 8790):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    store: Dict[str, Tuple[str, float]] = {}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, code: int, body: dict) -> None:
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.rstrip("/") in ("/health", "/stats"):
+                with lock:
+                    return self._send(200, {"ok": True, "entries": len(store)})
+            self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            try:
+                req = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+            except ValueError:
+                return self._send(400, {"error": "invalid json"})
+            now = time.time()
+            path = self.path.rstrip("/")
+            if path.endswith("/mget"):
+                with lock:
+                    values = {}
+                    for k in req.get("keys") or []:
+                        item = store.get(k)
+                        if item and (not item[1] or item[1] > now):
+                            values[k] = item[0]
+                        elif item:
+                            del store[k]
+                return self._send(200, {"values": values})
+            if path.endswith("/mset"):
+                ttl = int(req.get("ttl") or 0)
+                with lock:
+                    for k, v in (req.get("items") or {}).items():
+                        store[str(k)] = (str(v), now + ttl if ttl else 0.0)
+                return self._send(200, {"stored": len(req.get("items") or {})})
+            self._send(404, {"error": "not found"})
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="OpenAI Style Prompt – Remote-Cache")
+    ap.add_argument("command", choices=["serve", "ping"])
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8790)
+    args = ap.parse_args()
+    if args.command == "serve":
+        srv = make_server(args.host, args.port)
+        print(f"remote prompt cache on http://{args.host}:{srv.server_address[1]}")
+        srv.serve_forever()
+    else:
+        rc = shared_remote_cache()
+        if rc is None:
+            raise SystemExit("OPENAI_STYLE_PROMPT_REMOTE_CACHE ist nicht gesetzt")
+        t0 = time.perf_counter()
+        rc.get("ping")
+        print(json.dumps({"ok": rc.errors == 0, "ms": round((time.perf_counter() - t0) * 1000, 2)}))
@@ -0,0 +1,155 @@
+# ComfyUI/custom_nodes/openai_style_prompt/sanitizer.py
+# Subjectless Sanitizer – vorkompilierte Single-Pass-Engine
+import re
+from typing import Dict, List, Optional, Tuple
+
+# ----- Token-Listen -----
+FORBIDDEN_TOKENS_STRICT = [
+    "person","people","human","character","model","portrait","face","faces","hand","hands","silhouette",
+    "girl","boy","man","woman","male","female","child","children","kid","baby","selfie","body","bodies",
+    "actor","actress","figure","subject",
+    "animal","dog","cat","bird","horse","creature","monster","pet","wildlife","insect","fish",
+    "crowd","group","couple"
+]
+FORBIDDEN_TOKENS_LIGHT = [
+    "person","people","human",
+    "girl","boy","man","woman","male","female","child","children","kid","baby",
+    "animal","dog","cat","bird","horse","creature","monster","pet","wildlife"
+]
+FORBIDDEN_PHRASES_STRICT = [
+    r"\bfull[- ]?body\b", r"\bheadshot\b", r"\bselfie\b", r"\bgroup photo\b", r"\bclose[- ]?up\b"
+]
+
+# Deutsch: bewusst ohne "man" (Pronomen), "Paar"/"Menge" (ein paar, eine Menge), "Junge(n)" (junge Birken)
+# und "Hand" (Hand in Hand). Substantive werden case-sensitiv gesucht, damit Adjektive/Verben unberührt bleiben.
+FORBIDDEN_TOKENS_STRICT_DE = [
+    "Person","Personen","Mensch","Menschen","Menschenmenge","Figur","Figuren","Charakter","Charaktere",
+    "Model","Models","Porträt","Portrait","Gesicht","Gesichter","Hände","Silhouette","Silhouetten",
+    "Mädchen","Mann","Männer","Frau","Frauen","Kind","Kinder","Baby","Babys","Selfie",
+    "Körper","Schauspieler","Schauspielerin","Subjekt","Subjekte",
+    "Tier","Tiere","Hund","Hunde","Katze","Katzen","Vogel","Vögel","Pferd","Pferde","Kreatur","Kreaturen",
+    "Monster","Haustier","Haustiere","Wildtiere","Insekt","Insekten","Fisch","Fische",
+    "Gruppe","Pärchen",
+]
+FORBIDDEN_TOKENS_LIGHT_DE = [
+    "Person","Personen","Mensch","Menschen","Menschenmenge",
+    "Mädchen","Mann","Männer","Frau","Frauen","Kind","Kinder","Baby","Babys",
+    "Tier","Tiere","Hund","Hunde","Katze","Katzen","Vogel","Vögel","Pferd","Pferde","Kreatur","Kreaturen",
+    "Monster","Haustier","Haustiere","Wildtiere",
+]
+FORBIDDEN_PHRASES_STRICT_DE = [
+    r"\bganzkörper\w*", r"\bkopfporträt\w*", r"\bnahaufnahme\w*", r"\bgruppenfoto\w*", r"\bselfie\w*"
+]
+
+_SPLIT = re.compile(r"[;|–—−]")               # Semikolon, Pipe und Gedankenstriche trennen Segmente
+_WS = re.compile(r"\s+")
+_END_PUNCT = re.compile(r"[.!?]$")
+_TRAILING = re.compile(r"[;,\.\s]+$")
+
+
+def format_prompt(s: str) -> str:
+    if not s:
+        return s
+    seen = set()
+    uniq = []
+    for p in _SPLIT.split(s.strip()):
+        seg = p.strip(" ,.;:").strip()
+        low = seg.lower()
+        if seg and low not in seen:
+            seen.add(low)
+            uniq.append(seg)
+    out = _WS.sub(" ", ", ".join(uniq).strip())
+    if not _END_PUNCT.search(out):
+        out += "."
+    return out
+
+
+class SanitizerEngine:
+    """
+    Kompiliert pro (Sprache, Stärke) EIN Alternations-Pattern:
+      1. geschützte Negations-Spans ("no/without …" bis zum Satzende) -> unverändert
+      2. Kontext-Regel ("for a person" -> "for the background")
+      3. Läufe aus Phrasen/Tokens/Ersatzwort -> ein einziges Ersatzwort
+    und schreibt den Text in einem einzigen `sub`-Durchlauf um – ohne Platzhalter.
+    Weitere Sprachen über `register_language`.
+    """
+
+    def __init__(self):
+        self._langs: Dict[str, dict] = {}
+        self._compiled: Dict[Tuple[str, str], Tuple[re.Pattern, str]] = {}
+
+    def register_language(self, language: str, strict: List[str], light: List[str], phrases: List[str],
+                          negators: List[str], replacement: str, context: Optional[Tuple[str, str]] = None,
+                          strict_cased: List[str] = (), light_cased: List[str] = ()) -> None:
+        """`*_cased`: Tokens, die nur in exakter Schreibweise treffen (z.B. deutsche Substantive)."""
+        self._langs[language] = dict(strict=strict, light=light, phrases=phrases, negators=negators,
+                                     replacement=replacement, context=context,
+                                     strict_cased=list(strict_cased), light_cased=list(light_cased))
+        self._compiled = {k: v for k, v in self._compiled.items() if k[0] != language}
+
+    def _pattern(self, language: str, strength: str) -> Tuple[re.Pattern, str]:
+        lang = language if language in self._langs else "en"
+        ck = (lang, strength)
+        hit = self._compiled.get(ck)
+        if hit is not None:
+            return hit
+        cfg = self._langs[lang]
+        repl = cfg["replacement"]
+        tokens = cfg["light"] if strength == "light" else cfg["strict"]
+        # längere Alternativen zuerst, damit z.B. "Menschenmenge" nicht als "Mensch" endet
+        words = sorted({re.escape(t) for t in tokens} | {re.escape(repl)}, key=len, reverse=True)
+        units = ([f"(?:{p})" for p in cfg["phrases"]] if strength == "strict" else []) + [rf"\b(?:{'|'.join(words)})\b"]
+        cased = sorted({re.escape(t) for t in cfg["light_cased" if strength == "light" else "strict_cased"]}, key=len, reverse=True)
+        if cased:
+            units.append(rf"(?-i:\b(?:{'|'.join(cased)})\b)")
+        unit = "(?:" + "|".join(units) + ")"
+        branches = [rf"(?P<neg>\b(?:{'|'.join(map(re.escape, cfg['negators']))})\b[^.]*)"]
+        if strength == "strict" and cfg["context"]:
+            branches.append(rf"(?P<ctx>{cfg['context'][0]}(?:[\s-]+{unit})*)")
+        # Läufe auch über Bindestriche ("Ganzkörper-Silhouette" -> ein Ersatzwort statt "Hintergrund-Hintergrund")
+        branches.append(rf"(?P<hit>{unit}(?:[\s-]+{unit})*)")
+        compiled = (re.compile("|".join(branches), re.IGNORECASE), repl)
+        self._compiled[ck] = compiled
+        return compiled
+
+    def sanitize(self, s: str, strength: str, strip_trailing_punct: bool, language: str = "en") -> str:
+        out = (s or "").strip()
+        if strength != "off":
+            pattern, repl = self._pattern(language, strength)
+            ctx_repl = (self._langs.get(language) or self._langs["en"])["context"]
+
+            def _rewrite(m: re.Match) -> str:
+                if m.lastgroup == "neg":
+                    return m.group(0)
+                if m.lastgroup == "ctx":
+                    return ctx_repl[1]
+                hit = m.group(0)
+                return hit if hit.lower() == repl.lower() else repl
+
+            out = pattern.sub(_rewrite, out)
+        if strip_trailing_punct:
+            out = _TRAILING.sub("", out).strip()
+        return format_prompt(out)
+
+
+ENGINE = SanitizerEngine()
+ENGINE.register_language(
+    "en", FORBIDDEN_TOKENS_STRICT, FORBIDDEN_TOKENS_LIGHT, FORBIDDEN_PHRASES_STRICT,
+    negators=["no", "without"], replacement="background",
+    context=(r"\b(?:for|with)\s+(?:a|the)\s+(?:subject|person|character|model)\b", "for the background"),
+)
+# deutsche Ausgaben enthalten oft englische Lehnwörter -> EN-Listen mitnehmen (außer "man"/"hand", s.o.)
+_EN_IN_DE_EXCLUDE = {"man", "hand"}
+ENGINE.register_language(
+    "de",
+    [t for t in FORBIDDEN_TOKENS_STRICT if t not in _EN_IN_DE_EXCLUDE],
+    [t for t in FORBIDDEN_TOKENS_LIGHT if t not in _EN_IN_DE_EXCLUDE],
+    FORBIDDEN_PHRASES_STRICT_DE + FORBIDDEN_PHRASES_STRICT,
+    negators=["ohne", "kein", "keine", "keinen", "keinem", "keiner", "keines"], replacement="Hintergrund",
+    context=(r"\b(?:für|mit)\s+(?:eine[nmr]?|de[nmr]|die|das)\s+(?:Person|Figur|Model|Subjekt)\b", "für den Hintergrund"),
+    strict_cased=FORBIDDEN_TOKENS_STRICT_DE, light_cased=FORBIDDEN_TOKENS_LIGHT_DE,
+)
+
+
+def sanitize_subjects(s: str, strength: str, strip_trailing_punct: bool, language: str = "en") -> str:
+    return ENGINE.sanitize(s, strength, strip_trailing_punct, language)
@@ -0,0 +1,62 @@
+# ComfyUI/custom_nodes/openai_style_prompt/tests/test_api.py
+# Öffentliche Sync-Wrapper gegen einen Stub-Client (kein Netzwerk, kein API-Key nötig).
+#   python -m pytest -q tests
+import asyncio, importlib, pathlib, sys, types
+
+import pytest
+
+PKG_DIR = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PKG_DIR.parent))
+api = importlib.import_module(f"{PKG_DIR.name}.api")
+
+
+class StubResponses:
+    def __init__(self, text="quiet harbor at dawn"):
+        self.text = text
+        self.calls = []
+
+    async def create(self, **kwargs):
+        self.calls.append(kwargs)
+        await asyncio.sleep(0)
+        return types.SimpleNamespace(output_text=self.text, output=None,
+                                     usage={"input_tokens": 12, "output_tokens": 5})
+
+
+def stub_client(**kw):
+    return types.SimpleNamespace(responses=StubResponses(**kw))
+
+
+def test_call_openai_sync_wrapper():
+    client = stub_client()
+    sys_msg = api.build_system_msg("en")
+    parts = api.build_user_parts("Urban night", "", "", "cinematic", 3, None)
+    assert api.call_openai(client, "gpt-4o", sys_msg, parts, 100, 0.0, False) == "quiet harbor at dawn"
+    assert len(client.responses.calls) == 1
+    assert client.responses.calls[0]["model"] == "gpt-4o"
+
+
+def test_call_openai_once_sync_wrapper():
+    client = stub_client(text="  misty pier  ")
+    parts = api.build_user_parts("Foggy coast", "", "", "photography", 2, None)
+    assert api.call_openai_once(client, "gpt-4o-mini", api.build_system_msg("de"), parts, 50, 0.2) == "misty pier"
+    assert len(client.responses.calls) == 1
+
+
+def test_ensure_client_is_the_shared_async_client():
+    openai = pytest.importorskip("openai")
+    client = api.ensure_client("sk-test")
+    assert isinstance(client, openai.AsyncOpenAI)
+    assert client is api.ensure_async_client("sk-test")
+
+
+def test_local_errors_are_not_retried():
+    class Broken(StubResponses):
+        async def create(self, **kwargs):
+            self.calls.append(kwargs)
+            raise TypeError("object LegacyAPIResponse can't be used in 'await' expression")
+
+    client = types.SimpleNamespace(responses=Broken())
+    parts = api.build_user_parts("Urban night", "", "", "cinematic", 3, None)
+    with pytest.raises(TypeError):
+        api.call_openai(client, "gpt-4o", api.build_system_msg("en"), parts, 100, 0.0, False)
+    assert len(client.responses.calls) == 1
@@ -0,0 +1,35 @@
+# ComfyUI/custom_nodes/openai_style_prompt/tests/test_breaker.py
+# Circuit-Breaker: nur Transport-/Timeout-/5xx-Fehler zählen als Ausfall, lokale Fehler nie.
+import asyncio, importlib, pathlib, sys
+
+import pytest
+
+PKG_DIR = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PKG_DIR.parent))
+breaker = importlib.import_module(f"{PKG_DIR.name}.breaker")
+
+
+class StatusError(Exception):
+    def __init__(self, status_code, msg="boom"):
+        super().__init__(msg)
+        self.status_code = status_code
+
+
+@pytest.mark.parametrize("exc,expected", [
+    (StatusError(500), "outage"), (StatusError(503), "outage"), (asyncio.TimeoutError(), "outage"),
+    (StatusError(401), "auth"), (StatusError(429, "insufficient_quota"), "auth"),
+    (StatusError(429, "Rate limit reached"), None), (StatusError(400), None), (StatusError(409), None),
+    (TypeError("x"), None), (KeyError("x"), None), (ValueError("x"), None),
+])
+def test_failure_class(exc, expected):
+    assert breaker.failure_class(exc) == expected
+
+
+def test_local_errors_do_not_open_the_breaker():
+    b = breaker.CircuitBreaker(min_calls=3)
+    for _ in range(10):
+        b.failure(b.allow(), TypeError("bug"))
+    assert b.state == b.CLOSED and b.stats()["window_calls"] == 0
+    for _ in range(3):
+        b.failure(b.allow(), StatusError(503))
+    assert b.state == b.OPEN
@@ -0,0 +1,29 @@
+# ComfyUI/custom_nodes/openai_style_prompt/tests/test_cache.py
+# DiskCache: Refresh eines Keys behält den LFU-Zähler, übernommene Zeitstempel bleiben erhalten.
+import importlib, pathlib, sys, time
+
+PKG_DIR = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PKG_DIR.parent))
+cache = importlib.import_module(f"{PKG_DIR.name}.cache")
+
+
+def _row(dc, key):
+    return dc._conn.execute("SELECT prompt, created, hits FROM entries WHERE key=?", (key,)).fetchone()
+
+
+def test_put_keeps_hits_on_refresh(tmp_path):
+    dc = cache.DiskCache(tmp_path)
+    dc.put("k", "old")
+    for _ in range(3):
+        assert dc.get("k") == "old"
+    dc.put("k", "new")
+    prompt, _, hits = _row(dc, "k")
+    assert (prompt, hits) == ("new", 3)
+
+
+def test_put_with_original_created(tmp_path):
+    dc = cache.DiskCache(tmp_path)
+    created = time.time() - 3600
+    dc.put("k", "remote", created=created)
+    assert abs(_row(dc, "k")[1] - created) < 1e-3
+    assert dc.get("k", max_age_sec=1800) is None
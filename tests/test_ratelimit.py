@@ -0,0 +1,48 @@
+# ComfyUI/custom_nodes/openai_style_prompt/tests/test_ratelimit.py
+# Fehlerklassifikation: nur Transport-/Timeout-/408/409/429/5xx-Fehler sind retrybar.
+import asyncio, importlib, pathlib, sys
+
+import pytest
+
+PKG_DIR = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PKG_DIR.parent))
+ratelimit = importlib.import_module(f"{PKG_DIR.name}.ratelimit")
+
+
+class StatusError(Exception):
+    def __init__(self, status_code, msg="boom"):
+        super().__init__(msg)
+        self.status_code = status_code
+
+
+@pytest.mark.parametrize("status", [408, 409, 500, 502, 503])
+def test_retryable_status(status):
+    assert ratelimit.classify(StatusError(status)) == "retryable"
+
+
+@pytest.mark.parametrize("status", [400, 401, 403, 404, 413, 422])
+def test_fatal_status(status):
+    assert ratelimit.classify(StatusError(status)) == "fatal"
+
+
+def test_rate_limit_and_quota():
+    assert ratelimit.classify(StatusError(429, "Rate limit reached")) == "rate_limit"
+    assert ratelimit.classify(StatusError(429, "insufficient_quota")) == "quota"
+
+
+@pytest.mark.parametrize("exc", [TypeError("x"), KeyError("x"), ValueError("x"), RuntimeError("x")])
+def test_local_errors_are_fatal(exc):
+    assert ratelimit.classify(exc) == "fatal"
+
+
+def test_timeouts_are_retryable():
+    assert ratelimit.classify(asyncio.TimeoutError()) == "retryable"
+    assert ratelimit.classify(TimeoutError()) == "retryable"
+
+
+def test_openai_transport_errors_are_retryable():
+    openai = pytest.importorskip("openai")
+    httpx = pytest.importorskip("httpx")
+    req = httpx.Request("POST", "https://api.openai.com/v1/responses")
+    assert ratelimit.classify(openai.APIConnectionError(request=req)) == "retryable"
+    assert ratelimit.classify(openai.APITimeoutError(request=req)) == "retryable"
@@ -1,134 +1,215 @@
 # ComfyUI/custom_nodes/openai_style_prompt/utils.py
-import io, re, base64
-from typing import Optional, List
-try:
+from __future__ import annotations
+import io, base64, hashlib, threading
+from typing import TYPE_CHECKING, Optional, List
+if TYPE_CHECKING:
     from PIL import Image
-except Exception:
-    Image = None
-
-# ----- Subjectless Sanitizer -----
-FORBIDDEN_TOKENS_STRICT = [
-    "person","people","human","character","model","portrait","face","faces","hand","hands","silhouette",
-    "girl","boy","man","woman","male","female","child","children","kid","baby","selfie","body","bodies",
-    "actor","actress","figure","subject",
-    "animal","dog","cat","bird","horse","creature","monster","pet","wildlife","insect","fish",
-    "crowd","group","couple"
-]
-FORBIDDEN_TOKENS_LIGHT = [
-    "person","people","human",
-    "girl","boy","man","woman","male","female","child","children","kid","baby",
-    "animal","dog","cat","bird","horse","creature","monster","pet","wildlife"
-]
-FORBIDDEN_PHRASES_STRICT = [
-    r"\bfull[- ]?body\b", r"\bheadshot\b", r"\bselfie\b", r"\bgroup photo\b", r"\bclose[- ]?up\b"
-]
-
-def format_prompt(s: str) -> str:
-    if not s:
-        return s
-    txt = s.strip()
-    txt = re.sub(r"[–—−]", ";", txt)             # unify dashes
-    parts = re.split(r"[;|]", txt)
-    cleaned = []
-    for p in parts:
-        seg = p.strip(" ,.;:").strip()
-        if seg:
-            cleaned.append(seg)
-    seen = set()
-    uniq = []
-    for seg in cleaned:
-        low = seg.lower()
-        if low not in seen:
-            seen.add(low)
-            uniq.append(seg)
-    out = ", ".join(uniq).strip()
-    out = re.sub(r"\s+", " ", out)
-    if not re.search(r"[.!?]$", out):
-        out += "."
-    return out
 
-def sanitize_subjects(s: str, strength: str, strip_trailing_punct: bool) -> str:
-    out = (s or "").strip()
-    if strength == "off":
-        if strip_trailing_punct:
-            out = re.sub(r"[;,\.\s]+$", "", out).strip()
-        return format_prompt(out)
+_PIL_IMAGE = None
 
-    # protect "no/without ..." blocks
-    placeholders = []
-    def _protect(match):
-        placeholders.append(match.group(0))
-        return f"__NEG_BLOCK_{len(placeholders)-1}__"
-    out = re.sub(r"\b(no|without)\b[^\.]*", _protect, out, flags=re.IGNORECASE)
+def pil_image():
+    """PIL.Image erst bei der ersten Bildverarbeitung importieren (kürzerer ComfyUI-Start); None ohne Pillow."""
+    global _PIL_IMAGE
+    if _PIL_IMAGE is None:
+        try:
+            from PIL import Image
+        except Exception:
+            return None
+        _PIL_IMAGE = Image
+    return _PIL_IMAGE
 
-    tokens = FORBIDDEN_TOKENS_LIGHT if strength == "light" else FORBIDDEN_TOKENS_STRICT
-    for t in tokens:
-        out = re.sub(rf"\b{re.escape(t)}\b", "background", out, flags=re.IGNORECASE)
+# ----- Subjectless Sanitizer (siehe sanitizer.py) -----
+from .sanitizer import (FORBIDDEN_TOKENS_STRICT, FORBIDDEN_TOKENS_LIGHT, FORBIDDEN_PHRASES_STRICT,
+                        format_prompt, sanitize_subjects)
 
-    if strength == "strict":
-        for pat in FORBIDDEN_PHRASES_STRICT:
-            out = re.sub(pat, "background", out, flags=re.IGNORECASE)
-        out = re.sub(r"\b(for|with)\s+(a|the)\s+(subject|person|character|model)\b",
-                     "for the background", out, flags=re.IGNORECASE)
+# ----- Image helpers -----
+UPLOAD_FORMATS = {"png": ("PNG", "image/png"), "jpeg": ("JPEG", "image/jpeg"), "webp": ("WEBP", "image/webp")}
 
-    out = re.sub(r"\b(background)(\s+\1\b)+", r"\1", out, flags=re.IGNORECASE)
-    out = re.sub(r"\s+", " ", out).strip()
+_SCRATCH = threading.local()
+_CHUNK_ELEMS = 1 << 18  # Zeilenblock für die uint8-Umwandlung ohne Downsampling (~1 MB float32)
 
-    for i, blk in enumerate(placeholders):
-        out = out.replace(f"__NEG_BLOCK_{i}__", blk)
+def _scratch(name: str, shape, dtype):
+    """Wiederverwendbarer Puffer pro Thread (Konvertierung läuft je Frame, u.a. aus Worker-Threads)."""
+    import numpy as np
+    buf = getattr(_SCRATCH, name, None)
+    if buf is None or buf.shape != tuple(shape) or buf.dtype != dtype:
+        buf = np.empty(shape, dtype=dtype)
+        setattr(_SCRATCH, name, buf)
+    return buf
 
-    if strip_trailing_punct:
-        out = re.sub(r"[;,\.\s]+$", "", out).strip()
+def _box_factor(h: int, w: int, max_side: int) -> int:
+    if not max_side or max_side <= 0:
+        return 1
+    f = -(-max(h, w) // max_side)
+    return f if f > 1 and h // f >= 1 and w // f >= 1 else 1
 
-    return format_prompt(out)
+def downscale_array(arr, max_side: int, out=None):
+    """Box-Downsampling auf dem (Float-)Array, bevor eine uint8-Kopie entsteht.
+    Zwei zusammenhängende Summen (erst Zeilenblöcke, dann Spaltenblöcke), danach in-place * 1/f²;
+    `out` = optionaler float32-Zielpuffer."""
+    if getattr(arr, "ndim", 0) < 2:
+        return arr
+    h, w = int(arr.shape[0]), int(arr.shape[1])
+    f = _box_factor(h, w, max_side)
+    if f <= 1:
+        return arr
+    import numpy as np
+    h2, w2, rest = h // f, w // f, arr.shape[2:]
+    if out is None:
+        out = np.empty((h2, w2, *rest), dtype=np.float32)
+    rows = arr[:h2 * f].reshape(h2, f, w, *rest).sum(axis=1, dtype=np.float32)
+    rows[:, :w2 * f].reshape(h2, w2, f, *rest).sum(axis=2, dtype=np.float32, out=out)
+    out *= 1.0 / (f * f)
+    return out
 
-# ----- Image helpers -----
-def tensor_to_pil(image_tensor) -> Optional[Image.Image]:
+def frame_count(image_tensor) -> int:
+    if image_tensor is None:
+        return 0
+    shape = getattr(image_tensor, "shape", ())
+    return int(shape[0]) if len(shape) == 4 else 1
+
+def _frame_u8_device(frame, max_side: int):
+    """Torch-Pfad: Downsampling (avg_pool2d) und uint8-Quantisierung auf dem Device des Tensors;
+    zur CPU wandert nur der reduzierte uint8-Puffer."""
+    import torch
+    import torch.nn.functional as F
+    with torch.no_grad():
+        x = frame.detach()
+        h, w = int(x.shape[0]), int(x.shape[1])
+        f = _box_factor(h, w, max_side)
+        if f > 1:
+            x = x[:(h // f) * f, :(w // f) * f]
+            if not x.is_floating_point() or (x.device.type == "cpu" and x.dtype in (torch.float16, torch.bfloat16)):
+                x = x.float()  # avg_pool2d: kein Half auf älteren CPU-Builds
+            chw = x.unsqueeze(0) if x.ndim == 2 else x.permute(2, 0, 1)
+            x = F.avg_pool2d(chw.unsqueeze(0), f).squeeze(0)
+            x = x.squeeze(0) if frame.ndim == 2 else x.permute(1, 2, 0)
+        if x.dtype != torch.uint8:
+            lo, hi = torch.aminmax(x)
+            scale = 255.0 if float(hi) <= 1.01 and float(lo) >= 0.0 else 1.0
+            x = (x * scale).clamp_(0, 255).to(torch.uint8)  # nur eine Kopie in Zielgröße (bzw. Frame-Größe ohne Downsampling)
+        return x.contiguous().cpu().numpy()
+
+def _frame_u8_host(arr, max_side: int):
+    """NumPy-Pfad: Downsampling in einen Thread-Puffer, Skalierung/Clipping in-place, dann eine uint8-Kopie.
+    Ohne Downsampling wird zeilenblockweise direkt ins uint8-Ergebnis geschrieben (kein Vollbild-float32-Puffer)."""
+    import numpy as np
+    arr = np.asarray(arr)
+    h, w = int(arr.shape[0]), int(arr.shape[1])
+    f = _box_factor(h, w, max_side)
+    if f > 1:
+        src = downscale_array(arr, max_side, out=_scratch("down", (h // f, w // f, *arr.shape[2:]), np.float32))
+    elif arr.dtype == np.uint8:
+        return arr
+    else:
+        src = arr
+    amax, amin = float(src.max()), float(src.min())
+    scale = 255.0 if amax <= 1.01 and amin >= 0.0 else 1.0
+    if f > 1:
+        np.multiply(src, scale, out=src)
+        np.clip(src, 0, 255, out=src)
+        return src.astype(np.uint8)
+    out = np.empty(arr.shape, dtype=np.uint8)
+    rows = max(1, _CHUNK_ELEMS // max(1, arr[0].size))
+    buf = _scratch("rows", (min(rows, h), *arr.shape[1:]), np.float32)
+    for y in range(0, h, rows):
+        part = buf[:min(rows, h - y)]
+        np.multiply(arr[y:y + rows], scale, out=part, casting="unsafe")
+        np.clip(part, 0, 255, out=part)
+        np.copyto(out[y:y + rows], part, casting="unsafe")
+    return out
+
+def tensor_to_pil(image_tensor, max_side: int = 0, index: int = 0) -> Optional[Image.Image]:
+    """Ein Frame -> PIL. Frame-Auswahl, Downsampling und uint8-Umwandlung passieren vor dem Transfer zur CPU."""
+    Image = pil_image()
     if image_tensor is None or Image is None:
         return None
     arr = image_tensor
-    if hasattr(arr, "cpu"):
-        arr = arr.cpu().numpy()
     if getattr(arr, "ndim", 0) == 4:
-        arr = arr[0]
+        arr = arr[index]
     try:
-        amax = float(arr.max()) if hasattr(arr, "max") else 1.0
-        amin = float(arr.min()) if hasattr(arr, "min") else 0.0
-        if amax <= 1.01 and amin >= 0.0:
-            arr = (arr * 255.0).clip(0, 255).astype("uint8")
-        else:
-            arr = arr.clip(0, 255).astype("uint8")
-        return Image.fromarray(arr)
+        if hasattr(arr, "cpu"):
+            return Image.fromarray(_frame_u8_device(arr, max_side))
+        return Image.fromarray(_frame_u8_host(arr, max_side))
     except Exception:
         return None
 
-def image_to_b64(image_tensor) -> Optional[str]:
-    pil = tensor_to_pil(image_tensor)
+def encode_image(pil: Image.Image, fmt: str = "png", quality: int = 90):
+    """-> (data_url, encoded_bytes). JPEG/WebP werden verlustbehaftet mit `quality` geschrieben."""
     if pil is None:
-        return None
+        return None, 0
+    pil_fmt, mime = UPLOAD_FORMATS.get(fmt, UPLOAD_FORMATS["png"])
+    img = pil
+    if pil_fmt == "JPEG" and img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
     buf = io.BytesIO()
-    pil.save(buf, format="PNG")
-    import base64
-    return "data:image/png;base64," + base64.b64encode(buf.getvalue()).decode("utf-8")
+    if pil_fmt == "PNG":
+        img.save(buf, format=pil_fmt)
+    else:
+        img.save(buf, format=pil_fmt, quality=int(quality))
+    data = buf.getvalue()
+    return f"data:{mime};base64," + base64.b64encode(data).decode("utf-8"), len(data)
+
+def pil_to_b64(pil: Image.Image, fmt: str = "png", quality: int = 90) -> Optional[str]:
+    return encode_image(pil, fmt, quality)[0]
+
+def image_to_b64(image_tensor) -> Optional[str]:
+    return pil_to_b64(tensor_to_pil(image_tensor))
 
 def ahash_8x8(pil: Image.Image) -> str:
-    img = pil.convert("L").resize((8, 8), Image.BILINEAR)
+    img = pil.convert("L").resize((8, 8), pil_image().BILINEAR)
     pixels = list(img.getdata())
     avg = sum(pixels) / len(pixels)
     bits = ''.join('1' if p > avg else '0' for p in pixels)
     return f"{int(bits, 2):016x}"
 
-def vision_hash(image_tensor) -> str:
-    if image_tensor is None or Image is None:
-        return ""
-    pil = tensor_to_pil(image_tensor)
+def dhash_8x8(pil: Image.Image) -> str:
+    """Difference-Hash: robuster gegen Helligkeits-/Grading-Änderungen als der Average-Hash."""
+    img = pil.convert("L").resize((9, 8), pil_image().BILINEAR)
+    px = list(img.getdata())
+    bits = ''.join('1' if px[r * 9 + c] > px[r * 9 + c + 1] else '0' for r in range(8) for c in range(8))
+    return f"d{int(bits, 2):016x}"
+
+HASHERS = {"ahash": ahash_8x8, "dhash": dhash_8x8}
+
+def pil_hash(pil: Image.Image, mode: str = "ahash") -> str:
     if pil is None:
         return ""
     try:
-        return ahash_8x8(pil)
+        return HASHERS.get(mode, ahash_8x8)(pil)
     except Exception:
         return ""
 
+def hash_bits(vhash: str) -> Optional[int]:
+    """64-bit-Wert eines vision_hash (ahash: 16 Hex-Zeichen, dhash: 'd' + 16 Hex-Zeichen)."""
+    try:
+        return int(vhash[-16:], 16) if vhash else None
+    except ValueError:
+        return None
+
+def vision_hash(image_tensor) -> str:
+    if image_tensor is None or pil_image() is None:
+        return ""
+    return pil_hash(tensor_to_pil(image_tensor))
+
+def tensor_fingerprint(image_tensor, samples: int = 65536) -> str:
+    """Schneller Fingerabdruck eines IMAGE-Tensors (Shape, Dtype, gleichmäßige Stichprobe)
+    ohne PIL-Konvertierung oder PNG-Encode – für IS_CHANGED."""
+    if image_tensor is None:
+        return ""
+    shape = tuple(int(d) for d in getattr(image_tensor, "shape", ()))
+    h = hashlib.blake2b(f"{shape}|{getattr(image_tensor, 'dtype', '')}".encode("utf-8"), digest_size=16)
+    try:
+        flat = image_tensor.reshape(-1)
+        step = max(1, int(flat.shape[0]) // samples)
+        sample = flat[::step][:samples]
+        if hasattr(sample, "cpu"):
+            sample = sample.detach().cpu().numpy()
+        h.update(sample.tobytes())
+    except Exception:
+        h.update(str(id(image_tensor)).encode("utf-8"))
+    return h.hexdigest()
+
 # ----- Model choice -----
 def choose_model(selected: str, override: str, cost_mode: str, has_image: bool, debug: bool) -> str:
     if override and override.strip():
@@ -144,3 +225,24 @@ def choose_model(selected: str, override: str, cost_mode: str, has_image: bool,
     chosen = "gpt-4o" if has_image else "gpt-5-mini"
     if debug: print(f"[OpenAIStylePrompt] cost_mode=auto, using: {chosen}")
     return chosen
+
+# nächstschnellere Stufe für Hedged Requests (None = bereits die schnellste Stufe)
+FASTER_MODEL = {
+    "gpt-5": "gpt-5-mini",
+    "gpt-5-mini": "gpt-5-nano",
+    "gpt-4o": "gpt-4o-mini",
+    "gpt-4.1": "gpt-4.1-mini",
+    "gpt-4.1-mini": "gpt-5-nano",
+    "gpt-4-turbo": "gpt-4o-mini",
+    "gpt-4": "gpt-4o-mini",
+    "o1-preview": "o1-mini",
+    "o1-mini": "gpt-5-mini",
+}
+TEXT_ONLY_MODELS = {"gpt-3.5-turbo", "gpt-4", "o1-mini"}
+
+def faster_model(model: str, has_image: bool) -> Optional[str]:
+    """Schnelleres Modell derselben Familie; mit Bild nur vision-fähige Modelle."""
+    m = FASTER_MODEL.get(model)
+    if m and has_image and m in TEXT_ONLY_MODELS:
+        m = "gpt-4o-mini"
+    return m
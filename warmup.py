@@ -0,0 +1,146 @@
+# ComfyUI/custom_nodes/openai_style_prompt/warmup.py
+# Cache-Warm-up außerhalb von ComfyUI: Preset-Matrix oder JSONL-Replay -> DiskCache.
+#   cd ComfyUI/custom_nodes
+#   python -m openai_style_prompt.warmup --presets "Greenscreen Studio,Office" --tones all --languages de,en --details 3-5
+#   python -m openai_style_prompt.warmup --replay requests.jsonl --concurrency 4
+# Nutzt dieselbe Pipeline wie der Node (_prepare/cache_key/_fan_out) -> gewärmte Einträge sind Runtime-Treffer.
+# Bereits vorhandene Keys werden übersprungen; ein Abbruch kann einfach erneut gestartet werden.
+import argparse, itertools, json, pathlib, sys, time
+from typing import Iterator, List
+
+from .cache import DiskCache
+from .metrics import REGISTRY
+from .node import OpenAIStylePrompt
+from .presets import PRESETS
+from .remote_cache import shared_remote_cache
+
+TONES = ["neutral", "cinematic", "photography", "illustration", "product"]
+
+
+def _items(s: str, universe: List[str]) -> List[str]:
+    if not s or s.strip().lower() == "all":
+        return list(universe)
+    out = []
+    for t in (x.strip() for x in s.split(",")):
+        if t and t not in universe:
+            raise SystemExit(f"unknown value {t!r}; choose from: {', '.join(universe)}")
+        if t:
+            out.append(t)
+    return out
+
+
+def _range(s: str) -> List[int]:
+    out = set()
+    for part in (s or "1-5").split(","):
+        lo, _, hi = part.strip().partition("-")
+        out.update(range(int(lo), int(hi or lo) + 1))
+    return sorted(d for d in out if 1 <= d <= 5)
+
+
+def base_inputs(args) -> dict:
+    """Node-Defaults (required + optional) mit den CLI-Overrides."""
+    types = OpenAIStylePrompt.INPUT_TYPES()
+    p = {k: spec[1]["default"] for k, spec in types["required"].items() if len(spec) > 1 and "default" in spec[1]}
+    p.update(OpenAIStylePrompt._optional_defaults())
+    p.update(model=args.model, cost_mode=args.cost_mode, template_mode=args.template_mode,
+             max_tokens=args.max_tokens, temperature=args.temperature, sanitizer_strength=args.sanitizer_strength,
+             use_cache=True, debug_log=args.debug)
+    return p
+
+
+def matrix(args, base: dict) -> Iterator[dict]:
+    presets = [p.strip() for p in args.presets.split(",")] if args.presets.strip().lower() != "all" else list(PRESETS)
+    for name in presets:
+        if name not in PRESETS:
+            raise SystemExit(f"unknown preset {name!r}")
+    for preset, tone, language, detail in itertools.product(
+            presets, _items(args.tones, TONES), _items(args.languages, ["de", "en"]), _range(args.details)):
+        yield dict(base, preset=preset, prompt_tone=tone, language=language, detail_level=detail)
+
+
+def replay(path: str, base: dict, skipped: list) -> Iterator[dict]:
+    """Eine Zeile = ein Node-Aufruf als JSON-Objekt (nur bekannte Inputs; Bilder werden ignoriert)."""
+    for n, line in enumerate(pathlib.Path(path).read_text(encoding="utf-8").splitlines(), 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            skipped.append(n)
+            continue
+        known = {k: v for k, v in row.items() if k in base and k != "image"} if isinstance(row, dict) else {}
+        if not any(k in known for k in ("preset", "preset_override", "style_addon")):
+            skipped.append(n)
+            continue
+        yield dict(base, **known)
+
+
+def cost_so_far() -> float:
+    return sum(v for (name, _), v in REGISTRY.counters.items() if name == "cost_usd_total")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="OpenAI Style Prompt – Cache-Warm-up")
+    ap.add_argument("--presets", default="all", help="kommagetrennt oder 'all'")
+    ap.add_argument("--tones", default="all", help="kommagetrennt oder 'all'")
+    ap.add_argument("--languages", default="de,en")
+    ap.add_argument("--details", default="1-5", help="z.B. '3-5' oder '1,3,5'")
+    ap.add_argument("--replay", default="", help="JSONL mit Node-Inputs pro Zeile statt der Matrix")
+    ap.add_argument("--model", default="gpt-4o")
+    ap.add_argument("--cost-mode", default="auto", choices=["auto", "cheap", "premium"])
+    ap.add_argument("--template-mode", default="off", choices=["auto", "on", "off"])
+    ap.add_argument("--max-tokens", type=int, default=350)
+    ap.add_argument("--temperature", type=float, default=0.0)
+    ap.add_argument("--sanitizer-strength", default="strict", choices=["off", "light", "strict"])
+    ap.add_argument("--concurrency", type=int, default=4)
+    ap.add_argument("--limit", type=int, default=0, help="höchstens N neue Einträge")
+    ap.add_argument("--cache-dir", default="", help="Standard: COMFYUI_USER_PATH/openai_style_prompt_cache")
+    ap.add_argument("--dry-run", action="store_true", help="nur zählen, keine API-Calls")
+    ap.add_argument("--debug", action="store_true")
+    args = ap.parse_args(argv)
+
+    node = OpenAIStylePrompt()
+    if args.cache_dir:
+        node.cache = DiskCache(pathlib.Path(args.cache_dir))
+    base = base_inputs(args)
+    skipped_lines: list = []
+    inputs = replay(args.replay, base, skipped_lines) if args.replay else matrix(args, base)
+
+    todo, seen, cached = [], set(), 0
+    for p in inputs:
+        req = node._prepare(p, None)
+        if req["key"] in seen:
+            continue
+        seen.add(req["key"])
+        if node.cache.get(req["key"]) is not None:
+            cached += 1
+            continue
+        todo.append(req)
+    if args.limit:
+        todo = todo[:args.limit]
+    print(f"[warmup] {len(seen)} unique requests, {cached} already cached, {len(todo)} to generate"
+          + (f", {len(skipped_lines)} replay lines ignored" if skipped_lines else ""), file=sys.stderr)
+    if args.dry_run or not todo:
+        return 0
+
+    chunk = max(1, args.concurrency) * 4
+    t0 = time.time()
+    done = 0
+    for i in range(0, len(todo), chunk):
+        part = todo[i:i + chunk]
+        node._fan_out(part, args.concurrency)
+        done += len(part)
+        elapsed = time.time() - t0
+        eta = elapsed / done * (len(todo) - done)
+        print(f"[warmup] {done}/{len(todo)}  {elapsed:6.1f}s  eta {eta:6.1f}s  cost ${cost_so_far():.4f}", file=sys.stderr)
+    remote = shared_remote_cache()
+    if remote is not None:
+        remote.flush()
+    fallbacks = REGISTRY.counters.get(("generated_total", (("source", "fallback"),)), 0)
+    print(json.dumps({"generated": done, "already_cached": cached, "api_fallbacks": int(fallbacks),
+                      "cost_usd": round(cost_so_far(), 6), "seconds": round(time.time() - t0, 2)}))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())